@@ -169,3 +169,19 @@ STRIPE_PRICE_ID = config('STRIPE_PRICE_ID', default='')  # Monthly subscription
 
 # Your domain for payment redirects
 DOMAIN = config('DOMAIN', default='http://localhost:8000')
+
+# Scheduled rebalancing
+# 'worker': runs in `python manage.py run_rebalancer` processes; 'web': inside the web process
+REBALANCER_MODE = config('REBALANCER_MODE', default='worker')
+# Seconds between full syncs (heartbeat, lease renewal, session reconciliation)
+REBALANCER_POLL_INTERVAL = config('REBALANCER_POLL_INTERVAL', default=5, cast=float)
+# Session ownership lease per worker, renewed by heartbeat; a crashed worker's
+# sessions move to the others after at most this many seconds
+REBALANCER_LEASE_SECONDS = config('REBALANCER_LEASE_SECONDS', default=30, cast=float)
+# Overdue sessions found on startup/failover: catch-up starts per second and random delay per start
+REBALANCER_CATCHUP_RATE = config('REBALANCER_CATCHUP_RATE', default=1.0, cast=float)
+REBALANCER_STARTUP_JITTER = config('REBALANCER_STARTUP_JITTER', default=5.0, cast=float)
+# Seconds between cheap checks for session changes made by the web tier (0 disables)
+REBALANCER_WAKE_PROBE_INTERVAL = config('REBALANCER_WAKE_PROBE_INTERVAL', default=0.25, cast=float)
+# Seconds between writes of live stream balances to TraderSession.last_portfolio for the web tier
+REBALANCER_PORTFOLIO_PUBLISH_INTERVAL = config('REBALANCER_PORTFOLIO_PUBLISH_INTERVAL', default=10, cast=float)
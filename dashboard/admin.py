@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
-from .models import UserProfile, TraderSession, TradeHistory
+from .models import UserProfile, TraderSession, TradeHistory, RebalancerWorker
 
 
 class UserProfileInline(admin.StackedInline):
@@ -41,7 +41,7 @@ admin.site.register(User, UserAdmin)
 
 @admin.register(TraderSession)
 class TraderSessionAdmin(admin.ModelAdmin):
-    list_display = ('user', 'is_running', 'dry_run_mode', 'next_run_time', 'last_run_time', 'updated_at')
+    list_display = ('user', 'is_running', 'dry_run_mode', 'next_run_time', 'last_run_time', 'lease_holder', 'updated_at')
     list_filter = ('is_running', 'dry_run_mode', 'created_at')
     search_fields = ('user__username', 'user__email')
     readonly_fields = ('created_at', 'updated_at', 'last_portfolio', 'last_rebalance_result')
@@ -54,3 +54,10 @@ class TradeHistoryAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'user__email')
     readonly_fields = ('created_at', 'trade_data', 'error_message')
     ordering = ('-created_at',)
+
+
+@admin.register(RebalancerWorker)
+class RebalancerWorkerAdmin(admin.ModelAdmin):
+    list_display = ('worker_id', 'hostname', 'pid', 'started_at', 'heartbeat_at')
+    readonly_fields = ('worker_id', 'hostname', 'pid', 'started_at', 'heartbeat_at')
+    ordering = ('-heartbeat_at',)
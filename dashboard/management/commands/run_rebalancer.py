@@ -0,0 +1,44 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from dashboard.rebalancer import RebalancerService
+
+
+class Command(BaseCommand):
+    help = 'Run scheduled rebalancing for all running trader sessions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Concurrent rebalance cycles in this process (default: REBALANCE_WORKERS or 8)'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=None,
+            help='Seconds between database polls (default: REBALANCER_POLL_INTERVAL)'
+        )
+
+    def handle(self, *args, **options):
+        service = RebalancerService(
+            max_workers=options['workers'],
+            poll_interval=options['poll_interval']
+        )
+        stop = threading.Event()
+
+        def request_stop(signum, frame):
+            self.stdout.write(f"Received signal {signum}, finishing running cycles...")
+            stop.set()
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        service.start()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebalancer started ({service.scheduler.max_workers} workers, "
+            f"polling every {service.poll_interval}s)"
+        ))
+
+        stop.wait()
+        service.stop(wait=True)
+        self.stdout.write(self.style.SUCCESS("Rebalancer stopped"))
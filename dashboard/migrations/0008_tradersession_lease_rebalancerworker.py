@@ -0,0 +1,34 @@
+# Generated by Django 4.2.25 on 2026-10-17 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0007_userprofile_binance_exchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tradersession',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, help_text='Ownership lapses unless renewed before this time', null=True),
+        ),
+        migrations.AddField(
+            model_name='tradersession',
+            name='lease_holder',
+            field=models.CharField(blank=True, db_index=True, help_text='Rebalancer worker that runs this session', max_length=128, null=True),
+        ),
+        migrations.CreateModel(
+            name='RebalancerWorker',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('worker_id', models.CharField(max_length=128, unique=True)),
+                ('hostname', models.CharField(blank=True, max_length=255)),
+                ('pid', models.IntegerField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('heartbeat_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.25 on 2026-10-17 00:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0008_tradersession_lease_rebalancerworker'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='drift_band_absolute',
+            field=models.DecimalField(decimal_places=2, default=5.0, help_text='Absolute band in percentage points of portfolio weight', max_digits=5),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='drift_band_enabled',
+            field=models.BooleanField(default=False, help_text='Rebalance only when an asset drifts outside its tolerance band'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='drift_band_relative',
+            field=models.DecimalField(decimal_places=2, default=25.0, help_text='Relative band in percent of the target weight', max_digits=5),
+        ),
+    ]
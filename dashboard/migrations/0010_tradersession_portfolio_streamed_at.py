@@ -0,0 +1,18 @@
+# Generated by Django 4.2.25 on 2026-10-17 01:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0009_userprofile_drift_bands'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tradersession',
+            name='portfolio_streamed_at',
+            field=models.DateTimeField(blank=True, help_text='When a rebalancer worker last published user data stream balances into last_portfolio', null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.25 on 2026-10-17 01:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0010_tradersession_portfolio_streamed_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tradersession',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -90,6 +90,26 @@ class UserProfile(models.Model):
         help_text="Minimum value for market orders (USD)"
     )
 
+    # Drift-band rebalancing: scheduled cycles trade only when an asset leaves its band
+    drift_band_enabled = models.BooleanField(
+        default=False,
+        help_text="Rebalance only when an asset drifts outside its tolerance band"
+    )
+
+    drift_band_absolute = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        default=5.00,
+        help_text="Absolute band in percentage points of portfolio weight"
+    )
+
+    drift_band_relative = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        default=25.00,
+        help_text="Relative band in percent of the target weight"
+    )
+
     # Binance Connection Settings - NEW
     EXCHANGE_CHOICES = [
         ('com', 'Binance.com (International)'),
@@ -331,6 +351,9 @@ class TraderSession(models.Model):
 
     # Last portfolio snapshot (JSON)
     last_portfolio = models.JSONField(default=dict, blank=True)
+    portfolio_streamed_at = models.DateTimeField(null=True, blank=True,
+                                                 help_text="When a rebalancer worker last published "
+                                                           "user data stream balances into last_portfolio")
 
     # Last rebalance result (JSON)
     last_rebalance_result = models.JSONField(default=dict, blank=True)
@@ -338,9 +361,16 @@ class TraderSession(models.Model):
     # Dry run mode
     dry_run_mode = models.BooleanField(default=True, help_text="Test mode (no real trades)")
 
+    # Rebalancer worker ownership (renewed by the owner's heartbeat)
+    lease_holder = models.CharField(max_length=128, blank=True, null=True, db_index=True,
+                                    help_text="Rebalancer worker that runs this session")
+    lease_expires_at = models.DateTimeField(null=True, blank=True,
+                                            help_text="Ownership lapses unless renewed before this time")
+
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    # Indexed: rebalancer workers poll Max(updated_at) to notice changes made by the web tier
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"Session: {self.user.username} ({'Running' if self.is_running else 'Stopped'})"
@@ -376,3 +406,14 @@ class TradeHistory(models.Model):
         return f"{self.user.username} - {self.trade_type} at {self.created_at}"
 
 
+class RebalancerWorker(models.Model):
+    """Live `run_rebalancer` processes; sessions are sharded across them"""
+    worker_id = models.CharField(max_length=128, unique=True)
+    hostname = models.CharField(max_length=255, blank=True)
+    pid = models.IntegerField(null=True, blank=True)
+
+    started_at = models.DateTimeField(auto_now_add=True)
+    heartbeat_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Worker {self.worker_id} (heartbeat {self.heartbeat_at})"
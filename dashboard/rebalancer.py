@@ -0,0 +1,468 @@
+"""
+Scheduled rebalancing.
+
+RebalancerService owns the scheduled cycles of one process.  The database
+is the work queue: the web tier only flips `TraderSession.is_running` and
+edits `next_run_time`, and the service mirrors running sessions into a
+RebalanceScheduler.  A change probe every `wake_probe_interval` seconds
+picks up sessions started, stopped or rescheduled by another process, and a
+full sync runs at least every `poll_interval` seconds to renew leases.
+
+It runs in dedicated `manage.py run_rebalancer` worker processes, or inside
+the web process when settings.REBALANCER_MODE is 'web'.  With several
+workers each one only runs the sessions it holds a lease on (see
+dashboard.sharding).  Balances of live user data streams are written back
+to `TraderSession.last_portfolio` every `portfolio_publish_interval`
+seconds, so the web tier can answer from them without a Binance call.
+"""
+import time
+import random
+import logging
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections
+from django.db.models import Max
+from django.utils import timezone
+
+from binance.exceptions import BinanceAPIException
+
+from trader.btceth_trader import BTCETH_CMC20_Trader
+from trader.client_pool import client_pool
+from trader.clock_sync import ClockSynchronizer, TIMESTAMP_ERROR_CODE
+from trader.drift import DriftBands
+from trader.http_sessions import proxy_url_from_config
+from .models import UserProfile, TraderSession, TradeHistory
+from .scheduler import RebalanceScheduler
+from .sharding import SessionLeases
+
+logger = logging.getLogger('general')
+
+
+# Traders of running users served by this process
+user_live_traders = {}  # {user_id: trader with a running user data stream}
+
+
+def get_or_create_profile(user):
+    """Get or create user profile"""
+    profile, created = UserProfile.objects.get_or_create(user=user)
+    return profile
+
+
+def get_or_create_session(user):
+    """Get or create trader session for user"""
+    session, created = TraderSession.objects.get_or_create(user=user)
+    return session
+
+
+def get_binance_credentials(profile):
+    """Decrypted (api_key, api_secret) of a profile; ValueError when missing"""
+    if not profile.has_binance_credentials():
+        raise ValueError("Please configure your Binance API credentials")
+
+    api_key, api_secret = profile.get_binance_credentials()
+
+    # Validate that credentials were successfully decrypted and are not None
+    if not api_key or not api_secret:
+        raise ValueError("Failed to retrieve Binance API credentials. Please reconfigure them in your profile settings.")
+
+    return api_key, api_secret
+
+
+def verify_user_credentials(user):
+    """
+    Check the user's Binance credentials with one signed request.
+
+    Unlike create_user_trader() this starts no price feed, clock sync or
+    exchange info loading, so it is cheap enough for a web request.
+    Raises ValueError when the credentials are missing or rejected.
+    """
+    profile = get_or_create_profile(user)
+    api_key, api_secret = get_binance_credentials(profile)
+
+    client, _ = client_pool.acquire(
+        api_key,
+        api_secret,
+        tld=profile.binance_exchange,
+        testnet=profile.use_testnet,
+        proxy_url=proxy_url_from_config(profile.get_proxy_config())
+    )
+    # Sign with the endpoint's offset if it has been measured, without waiting for one
+    offset = ClockSynchronizer.shared(client).offset
+    if offset is not None:
+        client.timestamp_offset = int(offset)
+
+    try:
+        client.get_account()
+    except BinanceAPIException as e:
+        if e.code == TIMESTAMP_ERROR_CODE:
+            # Clock skew, not bad credentials - the first cycle syncs the clock
+            logger.warning(f"[{user.username}] Credential check hit a timestamp error: {e.message}")
+            return
+        raise ValueError(f"Binance rejected the API credentials: {e.message}")
+
+
+def create_user_trader(user):
+    """Create trader instance with user's configuration"""
+    profile = get_or_create_profile(user)
+    api_key, api_secret = get_binance_credentials(profile)
+
+    # Get proxy configuration if enabled
+    proxy_config = profile.get_proxy_config()
+
+    trader = BTCETH_CMC20_Trader(
+        binance_api_key=api_key,
+        binance_api_secret=api_secret,
+        cmc_api_key=profile.cmc_api_key,
+        update_interval=profile.default_interval,
+        index_type=profile.cmc_index_type,  # NEW
+        min_trade_threshold=float(profile.min_trade_threshold),  # NEW
+        auto_convert_dust=profile.auto_convert_dust,  # NEW
+        use_testnet=profile.use_testnet,  # NEW - Testnet support
+        proxy_config=proxy_config,  # NEW - Proxy support
+        binance_tld=profile.binance_exchange,  # NEW - Exchange selection (com/us)
+        index_base=profile.index_base,
+        index_selection=profile.index_type
+    )
+
+    return trader
+
+
+def published_portfolio(session):
+    """
+    Stream balances a worker published for a session, while fresh.
+
+    Returns:
+        (balances, total) or None when no worker has published recently
+    """
+    if session.portfolio_streamed_at is None:
+        return None
+    max_age = timedelta(seconds=3 * settings.REBALANCER_PORTFOLIO_PUBLISH_INTERVAL)
+    if timezone.now() - session.portfolio_streamed_at > max_age:
+        return None
+    balances = session.last_portfolio or {}
+    total = sum(data.get('usdc_value', 0.0) for data in balances.values() if isinstance(data, dict))
+    return balances, total
+
+
+def stop_live_trader(user_id):
+    """Stop the user data stream of a user's live trader, if any"""
+    trader = user_live_traders.pop(user_id, None)
+    if trader is not None:
+        trader.stop_user_stream()
+
+
+def run_user_cycle(user_id):
+    """
+    One scheduled rebalance cycle for a user.
+
+    Returns:
+        Next run time, or None when the trader is no longer running
+    """
+    # Worker threads are long-lived: drop connections Django considers stale
+    close_old_connections()
+
+    user = User.objects.get(id=user_id)
+    profile = get_or_create_profile(user)
+    session = get_or_create_session(user)
+
+    if not session.is_running:
+        stop_live_trader(user_id)
+        print(f"⛔ [{user.username}] Trader stopped")
+        return None
+
+    interval = max(60, profile.default_interval)
+    scheduled_for = session.next_run_time
+
+    try:
+        # Create trader with user credentials (clients are pooled, so this is cheap)
+        trader = create_user_trader(user)
+
+        # Balances and fills are pushed to memory while the trader runs. The stream
+        # belongs to the pooled client, so each cycle's trader attaches to the same one
+        if trader.start_user_stream():
+            live = user_live_traders.get(user_id)
+            if live is not None and live.user_stream is not trader.user_stream:
+                live.stop_user_stream()  # the pooled client was replaced
+            user_live_traders[user_id] = trader
+        else:
+            stop_live_trader(user_id)
+
+        # Drift-band mode: a cheap probe decides whether the full rebalance is needed
+        drift = None
+        if profile.drift_band_enabled:
+            drift = trader.probe_drift(DriftBands(
+                absolute=float(profile.drift_band_absolute),
+                relative=float(profile.drift_band_relative)
+            ))
+
+        if drift is not None and not drift['breached']:
+            print(f"🎯 [{user.username}] Within drift bands "
+                  f"(max deviation {drift['max_deviation']:.2f}pp), no rebalance needed")
+            session.last_rebalance_result = {
+                "status": "within_bands",
+                "drift": drift,
+                "timestamp": timezone.now().isoformat()
+            }
+            session.last_run_time = timezone.now()
+            session.save(update_fields=['last_rebalance_result', 'last_run_time'])
+        else:
+            print(f"🔁 [{user.username}] Starting rebalance...")
+
+            # Get portfolio; the same prices and balances are reused by the rebalance
+            if drift is not None:
+                # Already valued by the drift probe
+                balances, total = trader.last_drift_portfolio
+            else:
+                balances, total = trader.get_all_binance_balances(trader.get_price_snapshot())
+            snapshot = trader.last_price_snapshot  # completed from REST if the stream missed a held asset
+            session.last_portfolio = balances
+            session.save(update_fields=['last_portfolio'])
+
+            # Execute rebalance
+            rebalance_result = trader.execute_portfolio_rebalance(
+                dry_run=session.dry_run_mode, portfolio=(balances, total), snapshot=snapshot
+            )
+
+            if drift is not None and isinstance(rebalance_result, dict):
+                rebalance_result['drift'] = drift
+
+            # Save result
+            session.last_rebalance_result = rebalance_result if rebalance_result else {"note": "no result"}
+            session.last_run_time = timezone.now()
+            session.save(update_fields=['last_rebalance_result', 'last_run_time'])
+
+            # Save to trade history
+            TradeHistory.objects.create(
+                user=user,
+                trade_type='rebalance',
+                dry_run=session.dry_run_mode,
+                trade_data=rebalance_result if rebalance_result else {},
+                success=True
+            )
+
+            print(f"✅ [{user.username}] Rebalance completed")
+
+    except Exception as e:
+        print(f"❌ [{user.username}] Error: {e}")
+        traceback.print_exc()
+
+        error_data = {"error": str(e), "trace": traceback.format_exc()}
+        session.last_rebalance_result = error_data
+        session.save(update_fields=['last_rebalance_result'])
+
+        TradeHistory.objects.create(
+            user=user,
+            trade_type='rebalance',
+            dry_run=session.dry_run_mode,
+            trade_data=error_data,
+            success=False,
+            error_message=str(e)
+        )
+
+    # The web tier may have stopped or rescheduled the session during the cycle
+    next_run_time = timezone.now() + timedelta(seconds=interval)
+    updated = TraderSession.objects.filter(
+        pk=session.pk, is_running=True, next_run_time=scheduled_for
+    ).update(next_run_time=next_run_time)
+
+    if not updated:
+        session.refresh_from_db(fields=['is_running', 'next_run_time'])
+        if not session.is_running:
+            stop_live_trader(user_id)
+            print(f"⛔ [{user.username}] Trader stopped")
+            return None
+        next_run_time = session.next_run_time
+
+    print(f"😴 [{user.username}] Next run at {next_run_time}")
+    return next_run_time
+
+
+class RebalancerService:
+    """Mirrors running TraderSession rows into a scheduler and runs their cycles"""
+
+    def __init__(self, max_workers: int = None, poll_interval: float = None, lease_seconds: float = None):
+        self.leases = SessionLeases(lease_seconds=lease_seconds)
+        self.scheduler = RebalanceScheduler(self._run_owned, max_workers)
+        # Several heartbeats per lease period, so a slow poll never loses a lease
+        self.poll_interval = min(poll_interval or settings.REBALANCER_POLL_INTERVAL,
+                                 self.leases.lease_seconds / 3)
+        # Overdue sessions (after a restart or a failover) start at most
+        # catchup_rate per second, each with up to startup_jitter seconds of jitter
+        self.catchup_rate = settings.REBALANCER_CATCHUP_RATE
+        self.startup_jitter = settings.REBALANCER_STARTUP_JITTER
+        self.catchup_grace = max(10.0, 2 * self.poll_interval)
+        self._catchup_next = 0.0
+        self._seen = {}  # user_id -> next_run_time last read from the database
+        # Between polls a cheap query notices sessions changed by another process
+        self.wake_probe_interval = settings.REBALANCER_WAKE_PROBE_INTERVAL
+        self.portfolio_publish_interval = settings.REBALANCER_PORTFOLIO_PUBLISH_INTERVAL
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _catchup_slot(self, now: float) -> float:
+        slot = max(now, self._catchup_next)
+        self._catchup_next = slot + 1.0 / self.catchup_rate
+        return slot + random.uniform(0, self.startup_jitter)
+
+    def sync(self):
+        """Heartbeat, claim this worker's shard of running sessions, schedule them"""
+        close_old_connections()
+        ring = self.leases.heartbeat()
+        running = dict(
+            TraderSession.objects.filter(is_running=True).values_list('user_id', 'next_run_time')
+        )
+
+        mine = {user_id for user_id in running if ring.owner(user_id) == self.leases.worker_id}
+        in_cycle = {user_id for user_id in running if self.scheduler.is_running(user_id)}
+        # Leases of sessions in a cycle are renewed even if the ring moved them
+        held = self.leases.acquire(mine | in_cycle)
+
+        # Hand sessions the ring gave to another worker over once idle
+        moved = held - mine - in_cycle
+        if moved:
+            self.leases.release(moved)
+        owned = held - moved
+
+        now = time.time()
+        catchup = 0
+        # Oldest first, so the most overdue sessions get the earliest catch-up slots
+        for user_id in sorted(owned, key=lambda u: running[u].timestamp() if running.get(u) else 0):
+            if self.scheduler.is_running(user_id):
+                continue  # the cycle reports its own next run time
+            next_run_time = running.get(user_id)
+            if self._seen.get(user_id, 0) == next_run_time and self.scheduler.next_run(user_id) is not None:
+                continue  # unchanged in the database and already queued
+            self._seen[user_id] = next_run_time
+
+            run_at = next_run_time.timestamp() if next_run_time else now
+            if now - run_at > self.catchup_grace:
+                # Missed while no worker owned it: one catch-up run, rate limited
+                run_at = self._catchup_slot(now)
+                catchup += 1
+            self.scheduler.schedule(user_id, run_at)
+
+        if catchup:
+            logger.info(f"Rebalancer {self.leases.worker_id}: {catchup} overdue sessions queued for catch-up "
+                        f"over ~{catchup / self.catchup_rate:.0f}s")
+
+        for user_id in set(self._seen) - owned:
+            del self._seen[user_id]
+
+        for user_id in self.scheduler.scheduled_users() - owned:
+            self.scheduler.cancel(user_id)
+            stop_live_trader(user_id)
+
+        for user_id in set(user_live_traders) - owned:
+            stop_live_trader(user_id)
+
+    def publish_portfolios(self):
+        """Write balances of live user data streams to their sessions for the web tier"""
+        now = timezone.now()
+        for user_id, trader in list(user_live_traders.items()):
+            cached = trader.get_cached_balances()
+            if cached is None:
+                continue
+            # A plain UPDATE leaves updated_at alone, so this does not trip the change probe
+            TraderSession.objects.filter(user_id=user_id).update(
+                last_portfolio=cached[0], portfolio_streamed_at=now
+            )
+
+    def _probe(self):
+        """Latest TraderSession change; differs whenever a view starts, stops or reschedules one"""
+        close_old_connections()
+        return TraderSession.objects.aggregate(changed=Max('updated_at'))['changed']
+
+    def _run_owned(self, user_id):
+        """Scheduler job: run a cycle only while this worker still holds the lease"""
+        close_old_connections()
+        if not self.leases.holds(user_id):
+            return None
+        return run_user_cycle(user_id)
+
+    def start(self):
+        """Start the scheduler and the database polling thread (idempotent)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        # Sessions of a crashed predecessor on this host need not wait for lease expiry
+        try:
+            self.leases.reap_dead_local_workers()
+        except Exception as e:
+            logger.error(f"Failed to reap dead rebalancer workers: {e}")
+        self.scheduler.start()
+        self._thread = threading.Thread(target=self._poll_loop, name='rebalancer-sync', daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        """Re-read the database now instead of at the next poll"""
+        self._wakeup.set()
+
+    def stop(self, wait: bool = True):
+        """Stop polling and dispatching; running cycles finish when wait is True"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.scheduler.stop(wait=wait)
+        for user_id in list(user_live_traders):
+            stop_live_trader(user_id)
+        try:
+            self.leases.leave()
+        except Exception as e:
+            logger.error(f"Failed to release rebalancer leases: {e}")
+
+    def _poll_loop(self):
+        last_sync = 0.0
+        last_publish = 0.0
+        last_change = None
+        woken = True
+        while not self._stopped.is_set():
+            if self.wake_probe_interval:
+                try:
+                    change = self._probe()
+                    woken = woken or change != last_change
+                    last_change = change
+                except Exception as e:
+                    logger.error(f"Rebalancer change probe failed: {e}")
+
+            if woken or time.monotonic() - last_sync >= self.poll_interval:
+                try:
+                    self.sync()
+                except Exception as e:
+                    logger.error(f"Rebalancer sync failed: {e}")
+                    logger.error(traceback.format_exc())
+                last_sync = time.monotonic()
+
+            if time.monotonic() - last_publish >= self.portfolio_publish_interval:
+                try:
+                    self.publish_portfolios()
+                except Exception as e:
+                    logger.error(f"Rebalancer portfolio publish failed: {e}")
+                last_publish = time.monotonic()
+
+            woken = self._wakeup.wait(self.wake_probe_interval or self.poll_interval)
+            self._wakeup.clear()
+
+
+_web_rebalancer = None
+_web_rebalancer_lock = threading.Lock()
+
+
+def web_rebalancer():
+    """
+    In-process service when REBALANCER_MODE is 'web' (started on first use),
+    None when scheduled rebalancing belongs to `manage.py run_rebalancer`.
+    """
+    global _web_rebalancer
+    if settings.REBALANCER_MODE != 'web':
+        return None
+    with _web_rebalancer_lock:
+        if _web_rebalancer is None:
+            _web_rebalancer = RebalancerService()
+            _web_rebalancer.start()
+        return _web_rebalancer
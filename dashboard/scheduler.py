@@ -0,0 +1,176 @@
+"""
+Central rebalance scheduler.
+
+One dispatcher thread keeps a min-heap of (next run time, user id) and hands
+due users to a bounded worker pool, instead of one sleeping thread per
+running trader.  The job returns the user's next run time (or None to stop
+scheduling them), and any user's next run can be moved or started on demand:
+
+    scheduler = RebalanceScheduler(run_user_cycle)
+    scheduler.start()
+    scheduler.schedule(user.id, session.next_run_time)
+    scheduler.run_now(user.id)
+"""
+import os
+import time
+import heapq
+import logging
+import itertools
+import threading
+import traceback
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger('general')
+
+REBALANCE_WORKERS = int(os.getenv('REBALANCE_WORKERS', 8))
+
+
+def _timestamp(when) -> float:
+    """Epoch seconds from a datetime, a number, or None (= now)"""
+    if when is None:
+        return time.time()
+    if isinstance(when, datetime):
+        return when.timestamp()
+    return float(when)
+
+
+class RebalanceScheduler:
+    """Heap of due times dispatched to a bounded thread pool"""
+
+    def __init__(self, job, max_workers: int = None):
+        """
+        Args:
+            job: callable(user_id) -> next run time (datetime/epoch) or None
+            max_workers: concurrent rebalance cycles
+        """
+        self.job = job
+        self.max_workers = max_workers or REBALANCE_WORKERS
+        self._heap = []            # (run_at, seq, user_id); stale entries are skipped
+        self._entries = {}         # user_id -> (run_at, seq) of the live heap entry
+        self._generation = {}      # user_id -> bumped by every schedule/cancel
+        self._running = set()
+        self._pending = set()      # became due while their previous cycle was running
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._executor = None
+        self._thread = None
+        self._stopped = False
+
+    def start(self):
+        """Start the dispatcher (idempotent)"""
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped = False
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='rebalance')
+            self._thread = threading.Thread(target=self._dispatch_loop, name='rebalance-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self, wait: bool = True):
+        """Stop dispatching; running cycles finish when wait is True"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+            thread, executor = self._thread, self._executor
+        if thread is not None:
+            thread.join()
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def schedule(self, user_id, when=None):
+        """(Re)schedule a user's next run; replaces any earlier schedule"""
+        run_at = _timestamp(when)
+        with self._cond:
+            seq = next(self._seq)
+            self._entries[user_id] = (run_at, seq)
+            self._generation[user_id] = self._generation.get(user_id, 0) + 1
+            heapq.heappush(self._heap, (run_at, seq, user_id))
+            self._cond.notify_all()
+
+    def run_now(self, user_id):
+        """Start a user's next run as soon as a worker is free"""
+        self.schedule(user_id, None)
+
+    def cancel(self, user_id):
+        """Drop a user's schedule; a cycle already running is not interrupted"""
+        with self._cond:
+            self._entries.pop(user_id, None)
+            self._pending.discard(user_id)
+            self._generation[user_id] = self._generation.get(user_id, 0) + 1
+            self._cond.notify_all()
+
+    def next_run(self, user_id):
+        """Scheduled epoch time of a user's next run, or None"""
+        with self._cond:
+            entry = self._entries.get(user_id)
+            return entry[0] if entry is not None else None
+
+    def scheduled_users(self) -> set:
+        """Users with a pending run"""
+        with self._cond:
+            return set(self._entries) | self._pending
+
+    def is_running(self, user_id) -> bool:
+        with self._cond:
+            return user_id in self._running
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'scheduled': len(self._entries),
+                'running': len(self._running),
+                'workers': self.max_workers,
+                'heap_size': len(self._heap),
+            }
+
+    def _dispatch_loop(self):
+        with self._cond:
+            while not self._stopped:
+                # Drop entries replaced by a later schedule() or cancel()
+                while self._heap and self._entries.get(self._heap[0][2], (None, None))[1] != self._heap[0][1]:
+                    heapq.heappop(self._heap)
+
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+
+                run_at, seq, user_id = self._heap[0]
+                delay = run_at - time.time()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+
+                heapq.heappop(self._heap)
+                del self._entries[user_id]
+
+                if user_id in self._running:
+                    # Previous cycle still in progress: run again as soon as it ends
+                    self._pending.add(user_id)
+                    continue
+
+                self._running.add(user_id)
+                self._executor.submit(self._run, user_id, self._generation.get(user_id, 0))
+
+    def _run(self, user_id, generation):
+        next_run = None
+        try:
+            next_run = self.job(user_id)
+        except Exception as e:
+            logger.error(f"Rebalance job failed for user {user_id}: {e}")
+            logger.error(traceback.format_exc())
+        finally:
+            with self._cond:
+                self._running.discard(user_id)
+                if user_id in self._pending:
+                    self._pending.discard(user_id)
+                    next_run = time.time()
+                elif self._generation.get(user_id, 0) != generation:
+                    # schedule()/cancel() during the run take precedence over the job's answer
+                    next_run = None
+                if next_run is not None and not self._stopped:
+                    run_at = _timestamp(next_run)
+                    seq = next(self._seq)
+                    self._entries[user_id] = (run_at, seq)
+                    heapq.heappush(self._heap, (run_at, seq, user_id))
+                self._cond.notify_all()
@@ -0,0 +1,141 @@
+"""
+Session ownership across rebalancer workers.
+
+Every running TraderSession is owned by exactly one worker through a lease
+(holder id + expiry) that the owner renews on each heartbeat.  Which worker
+should own a session is decided by a consistent-hash ring over the workers
+with a fresh heartbeat, so adding or removing a worker only moves about
+1/N of the sessions.  A crashed worker stops renewing: its heartbeat and
+leases lapse after one lease period and the ring hands its sessions to the
+survivors.
+"""
+import os
+import bisect
+import socket
+import uuid
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import TraderSession, RebalancerWorker
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+
+def make_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # exists, owned by another user
+    return True
+
+
+class HashRing:
+    """Consistent-hash ring with virtual nodes"""
+
+    VNODES = 64
+
+    def __init__(self, nodes=(), vnodes: int = None):
+        self.vnodes = vnodes or self.VNODES
+        self._ring = sorted(
+            (_hash(f"{node}#{i}"), node) for node in set(nodes) for i in range(self.vnodes)
+        )
+        self._keys = [h for h, _ in self._ring]
+
+    def owner(self, key):
+        """Node that owns a key, or None for an empty ring"""
+        if not self._ring:
+            return None
+        index = bisect.bisect(self._keys, _hash(str(key))) % len(self._ring)
+        return self._ring[index][1]
+
+
+class SessionLeases:
+    """Heartbeat, claim, renew and release of TraderSession leases for one worker"""
+
+    def __init__(self, worker_id: str = None, lease_seconds: float = None):
+        self.worker_id = worker_id or make_worker_id()
+        self.lease_seconds = lease_seconds or settings.REBALANCER_LEASE_SECONDS
+
+    @property
+    def lease(self) -> timedelta:
+        return timedelta(seconds=self.lease_seconds)
+
+    def heartbeat(self) -> HashRing:
+        """Record this worker as alive; returns the ring of live workers"""
+        now = timezone.now()
+        RebalancerWorker.objects.update_or_create(
+            worker_id=self.worker_id,
+            defaults={'heartbeat_at': now, 'hostname': socket.gethostname(), 'pid': os.getpid()}
+        )
+        # Prune long-dead workers; the ring only counts fresh heartbeats anyway
+        RebalancerWorker.objects.filter(heartbeat_at__lt=now - self.lease * 10).delete()
+        live = RebalancerWorker.objects.filter(heartbeat_at__gte=now - self.lease).values_list('worker_id', flat=True)
+        return HashRing(live)
+
+    def acquire(self, user_ids) -> set:
+        """
+        Claim or renew leases on running sessions that are free, expired or ours.
+
+        Returns:
+            user ids whose session this worker now holds
+        """
+        now = timezone.now()
+        TraderSession.objects.filter(user_id__in=user_ids, is_running=True).filter(
+            Q(lease_holder=self.worker_id) | Q(lease_holder__isnull=True) | Q(lease_expires_at__lt=now)
+        ).update(lease_holder=self.worker_id, lease_expires_at=now + self.lease)
+        return self.held()
+
+    def held(self) -> set:
+        """user ids of running sessions whose lease this worker holds"""
+        return set(TraderSession.objects.filter(
+            lease_holder=self.worker_id, is_running=True, lease_expires_at__gt=timezone.now()
+        ).values_list('user_id', flat=True))
+
+    def holds(self, user_id) -> bool:
+        return TraderSession.objects.filter(
+            user_id=user_id, lease_holder=self.worker_id, lease_expires_at__gt=timezone.now()
+        ).exists()
+
+    def release(self, user_ids=None):
+        """Give up leases (all of this worker's when user_ids is None)"""
+        sessions = TraderSession.objects.filter(lease_holder=self.worker_id)
+        if user_ids is not None:
+            sessions = sessions.filter(user_id__in=user_ids)
+        sessions.update(lease_holder=None, lease_expires_at=None)
+
+    def reap_dead_local_workers(self) -> int:
+        """
+        Release leases of workers on this host whose process is gone.
+
+        Remote workers can only be judged by their heartbeat, but a local pid
+        can be checked, so a restarted worker resumes its predecessor's
+        sessions at once instead of after a lease period.
+        """
+        hostname = socket.gethostname()
+        reaped = 0
+        for worker in RebalancerWorker.objects.filter(hostname=hostname).exclude(worker_id=self.worker_id):
+            if worker.pid is None or worker.pid == os.getpid() or _pid_alive(worker.pid):
+                continue
+            TraderSession.objects.filter(lease_holder=worker.worker_id).update(
+                lease_holder=None, lease_expires_at=None
+            )
+            worker.delete()
+            reaped += 1
+        return reaped
+
+    def leave(self):
+        """Clean shutdown: release every lease and drop out of the ring at once"""
+        self.release()
+        RebalancerWorker.objects.filter(worker_id=self.worker_id).delete()
@@ -1,7 +1,5 @@
 import json
 import traceback
-import threading
-import time
 import logging
 from datetime import datetime, timedelta
 from django.shortcuts import render, redirect
@@ -19,9 +17,16 @@ from django.utils import timezone
 from django.conf import settings
 import stripe
 
-from trader.btceth_trader import BTCETH_CMC20_Trader
+from trader.request_governor import governor
+from trader.http_sessions import latency
+from trader.client_pool import client_pool
+from trader.allocation import allocation_service
 from .models import UserProfile, TraderSession, TradeHistory
 from .decorators import subscription_required, trial_or_subscription_required
+from .rebalancer import (
+    get_or_create_profile, get_or_create_session, create_user_trader,
+    published_portfolio, user_live_traders, verify_user_credentials, web_rebalancer
+)
 
 # Configure Stripe
 stripe.api_key = settings.STRIPE_SECRET_KEY
@@ -32,10 +37,6 @@ api_logger = logging.getLogger('api')
 trade_logger = logging.getLogger('trades')
 
 
-# Thread management for each user
-user_trader_threads = {}  # {user_id: thread}
-
-
 def parse_bool(value, default=False):
     """Safely parse boolean-like values from various inputs"""
     if isinstance(value, bool):
@@ -55,50 +56,6 @@ def parse_bool(value, default=False):
         return default
 
 
-def get_or_create_profile(user):
-    """Get or create user profile"""
-    profile, created = UserProfile.objects.get_or_create(user=user)
-    return profile
-
-
-def get_or_create_session(user):
-    """Get or create trader session for user"""
-    session, created = TraderSession.objects.get_or_create(user=user)
-    return session
-
-
-def create_user_trader(user):
-    """Create trader instance with user's configuration"""
-    profile = get_or_create_profile(user)
-
-    if not profile.has_binance_credentials():
-        raise ValueError("Please configure your Binance API credentials")
-
-    api_key, api_secret = profile.get_binance_credentials()
-
-    # Validate that credentials were successfully decrypted and are not None
-    if not api_key or not api_secret:
-        raise ValueError("Failed to retrieve Binance API credentials. Please reconfigure them in your profile settings.")
-
-    # Get proxy configuration if enabled
-    proxy_config = profile.get_proxy_config()
-
-    trader = BTCETH_CMC20_Trader(
-        binance_api_key=api_key,
-        binance_api_secret=api_secret,
-        cmc_api_key=profile.cmc_api_key,
-        update_interval=profile.default_interval,
-        index_type=profile.cmc_index_type,  # NEW
-        min_trade_threshold=float(profile.min_trade_threshold),  # NEW
-        auto_convert_dust=profile.auto_convert_dust,  # NEW
-        use_testnet=profile.use_testnet,  # NEW - Testnet support
-        proxy_config=proxy_config,  # NEW - Proxy support
-        binance_tld=profile.binance_exchange  # NEW - Exchange selection (com/us)
-    )
-
-    return trader
-
-
 # ============================================
 # Authentication Views
 # ============================================
@@ -268,99 +225,27 @@ def index(request):
 # Trader Control
 # ============================================
 
-def stop_user_trader(user):
-    """Stop trader for specific user"""
-    user_id = user.id
-    if user_id in user_trader_threads:
-        # Signal thread to stop
-        session = get_or_create_session(user)
-        session.is_running = False
-        session.next_run_time = None
-        session.save()
-
-        # Wait a bit for thread to finish
-        thread = user_trader_threads.get(user_id)
-        if thread and thread.is_alive():
-            thread.join(timeout=2)
-
-        # Clean up
-        user_trader_threads.pop(user_id, None)
-
-
-def user_trader_loop(user_id):
-    """Background trader loop for specific user"""
-    try:
-        user = User.objects.get(id=user_id)
-        profile = get_or_create_profile(user)
-        session = get_or_create_session(user)
-
-        # Create trader with user credentials
-        trader = create_user_trader(user)
-        interval = profile.default_interval
-
-        while session.is_running:
-            # Refresh session from DB
-            session.refresh_from_db()
-            profile.refresh_from_db()
-            interval = max(60, profile.default_interval)
-
-            if not session.is_running:
-                break
+def notify_rebalancer():
+    """
+    Let the rebalancer pick up session changes now.
 
-            try:
-                print(f"🔁 [{user.username}] Starting rebalance...")
-
-                # Get portfolio
-                balances, total = trader.get_all_binance_balances()
-                session.last_portfolio = balances
-                session.save()
-
-                # Execute rebalance
-                rebalance_result = trader.execute_portfolio_rebalance(dry_run=session.dry_run_mode)
-
-                # Save result
-                session.last_rebalance_result = rebalance_result if rebalance_result else {"note": "no result"}
-                session.last_run_time = timezone.now()
-                session.next_run_time = timezone.now() + timedelta(seconds=interval)
-                session.save()
-
-                # Save to trade history
-                TradeHistory.objects.create(
-                    user=user,
-                    trade_type='rebalance',
-                    dry_run=session.dry_run_mode,
-                    trade_data=rebalance_result if rebalance_result else {},
-                    success=True
-                )
-
-                print(f"✅ [{user.username}] Rebalance completed")
-
-            except Exception as e:
-                print(f"❌ [{user.username}] Error: {e}")
-                traceback.print_exc()
+    Scheduled rebalancing runs in `manage.py run_rebalancer` workers, which
+    read TraderSession from the database; only the in-process service
+    (REBALANCER_MODE = 'web') can be woken directly.
+    """
+    service = web_rebalancer()
+    if service is not None:
+        service.wake()
 
-                error_data = {"error": str(e), "trace": traceback.format_exc()}
-                session.last_rebalance_result = error_data
-                session.save()
 
-                TradeHistory.objects.create(
-                    user=user,
-                    trade_type='rebalance',
-                    dry_run=session.dry_run_mode,
-                    trade_data=error_data,
-                    success=False,
-                    error_message=str(e)
-                )
-
-            # Wait for next cycle
-            print(f"😴 [{user.username}] Waiting {interval} seconds...")
-            time.sleep(interval)
-
-        print(f"⛔ [{user.username}] Trader loop stopped")
+def stop_user_trader(user):
+    """Stop trader for specific user"""
+    session = get_or_create_session(user)
+    session.is_running = False
+    session.next_run_time = None
+    session.save(update_fields=['is_running', 'next_run_time', 'updated_at'])
 
-    except Exception as e:
-        print(f"❌ [{user.username}] Fatal error in trader loop: {e}")
-        traceback.print_exc()
+    notify_rebalancer()
 
 
 @login_required
@@ -372,22 +257,19 @@ def start_trader(request):
     session = get_or_create_session(user)
 
     try:
-        # Verify credentials
-        create_user_trader(user)  # This will raise error if no credentials
+        # Verify credentials with one signed call (raises if missing or rejected)
+        verify_user_credentials(user)
 
         if session.is_running:
             return JsonResponse({'status': 'already_running'})
 
-        # Start trader thread
+        # Queue the first cycle right away; the rebalancer sets later run times
         session.is_running = True
         profile = get_or_create_profile(user)
-        session.next_run_time = timezone.now() + timedelta(seconds=max(60, profile.default_interval))
-        session.save()
-
-        thread = threading.Thread(target=user_trader_loop, args=(user.id,), daemon=True)
-        thread.start()
+        session.next_run_time = timezone.now()
+        session.save(update_fields=['is_running', 'next_run_time', 'updated_at'])
 
-        user_trader_threads[user.id] = thread
+        notify_rebalancer()
 
         remaining = max(0, int((session.next_run_time - timezone.now()).total_seconds())) if session.next_run_time else None
 
@@ -427,6 +309,9 @@ def get_status(request):
     profile = get_or_create_profile(request.user)
     session = get_or_create_session(request.user)
 
+    # Starts the in-process rebalancer after a web restart (REBALANCER_MODE = 'web')
+    web_rebalancer()
+
     remaining = None
     if session.next_run_time:
         remaining = max(0, int((session.next_run_time - timezone.now()).total_seconds()))
@@ -441,10 +326,18 @@ def get_status(request):
     logger.info(f"  - last_rebalance_result: {session.last_rebalance_result}")
     logger.info(f"  - rebalance_data items: {len(session.last_rebalance_result) if session.last_rebalance_result else 0}")
 
+    # Live balances from the user data stream when the trader is running: in this
+    # process (REBALANCER_MODE = 'web'), else as last published by the worker
+    portfolio = session.last_portfolio
+    trader = user_live_traders.get(request.user.id)
+    cached = trader.get_cached_balances() if trader is not None else None
+    if cached is not None:
+        portfolio = cached[0]
+
     response_data = {
         'is_running': session.is_running,
         'remaining': remaining,
-        'portfolio': session.last_portfolio,
+        'portfolio': portfolio,
         'rebalance': session.last_rebalance_result,
         'dry_run_mode': session.dry_run_mode,
         'default_interval': profile.default_interval,
@@ -458,6 +351,20 @@ def get_status(request):
     return JsonResponse(response_data)
 
 
+@login_required
+def binance_metrics(request):
+    """Shared Binance request-weight utilisation and connection stats (staff only)"""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+
+    return JsonResponse({
+        'request_weight': governor.stats(),
+        'latency': latency.snapshot(),
+        'client_pool': client_pool.stats(),
+        'allocations': allocation_service.stats(),
+    })
+
+
 @login_required
 def refresh_portfolio(request):
     """Fetch fresh portfolio data from Binance"""
@@ -472,14 +379,27 @@ def refresh_portfolio(request):
     logger.info(f"  - default_interval: {profile.default_interval}")
 
     try:
-        # Create trader with user credentials
-        logger.info(f"[{request.user.username}] Creating trader instance...")
-        trader = create_user_trader(user)
-        logger.info(f"[{request.user.username}] Trader instance created successfully")
+        # Answer from the user's live data stream: in this process, or as
+        # recently published by the rebalancer worker that runs it
+        trader = user_live_traders.get(user.id)
+        cached = trader.get_cached_balances() if trader is not None else None
+        published = published_portfolio(session) if cached is None else None
+
+        if cached is not None:
+            logger.info(f"[{request.user.username}] Using balances from the user data stream")
+            balances, total = cached
+        elif published is not None:
+            logger.info(f"[{request.user.username}] Using stream balances published by the rebalancer worker")
+            balances, total = published
+        else:
+            # Create trader with user credentials
+            logger.info(f"[{request.user.username}] Creating trader instance...")
+            trader = create_user_trader(user)
+            logger.info(f"[{request.user.username}] Trader instance created successfully")
 
-        # Fetch portfolio from Binance
-        logger.info(f"[{request.user.username}] Calling trader.get_all_binance_balances()...")
-        balances, total = trader.get_all_binance_balances()
+            # Fetch portfolio from Binance
+            logger.info(f"[{request.user.username}] Calling trader.get_all_binance_balances()...")
+            balances, total = trader.get_all_binance_balances()
 
         logger.info(f"[{request.user.username}] Portfolio fetched successfully:")
         logger.info(f"  - Number of assets: {len(balances)}")
@@ -489,7 +409,7 @@ def refresh_portfolio(request):
         # Save to session
         logger.info(f"[{request.user.username}] Saving portfolio to session...")
         session.last_portfolio = balances
-        session.save()
+        session.save(update_fields=['last_portfolio'])
         logger.info(f"[{request.user.username}] Portfolio saved to session")
 
         response_data = {
@@ -548,9 +468,11 @@ def manual_rebalance(request):
 
         # Get portfolio
         trade_logger.info(f"[{request.user.username}] Step 2: Fetching portfolio from Binance...")
-        balances, total = trader.get_all_binance_balances()
+        snapshot = trader.get_price_snapshot()
+        balances, total = trader.get_all_binance_balances(snapshot)
+        snapshot = trader.last_price_snapshot  # completed from REST if the stream missed a held asset
         session.last_portfolio = balances
-        session.save()
+        session.save(update_fields=['last_portfolio'])
         trade_logger.info(f"[{request.user.username}] ✓ Portfolio fetched:")
         trade_logger.info(f"[{request.user.username}]   - Assets: {len(balances)}")
         trade_logger.info(f"[{request.user.username}]   - Total value: ${total:.2f}")
@@ -563,16 +485,21 @@ def manual_rebalance(request):
         trade_logger.info(f"[{request.user.username}] Step 3: Executing rebalance...")
         trade_logger.info(f"[{request.user.username}]   - Mode: {'DRY RUN (TEST)' if is_dry_run else 'LIVE TRADING'}")
 
-        rebalance_result = trader.execute_portfolio_rebalance(dry_run=is_dry_run)
+        rebalance_result = trader.execute_portfolio_rebalance(
+            dry_run=is_dry_run, portfolio=(balances, total), snapshot=snapshot
+        )
 
         # Save result
         session.last_rebalance_result = rebalance_result if rebalance_result else {"note": "no result"}
         session.last_run_time = timezone.now()
+        # The session may have been started or stopped while the rebalance ran
+        session.refresh_from_db(fields=['is_running'])
         if session.is_running:
             session.next_run_time = timezone.now() + timedelta(seconds=max(60, profile.default_interval))
         else:
             session.next_run_time = None
-        session.save()
+        session.save(update_fields=['last_rebalance_result', 'last_run_time', 'next_run_time', 'updated_at'])
+        notify_rebalancer()
 
         trade_logger.info(f"[{request.user.username}] ✓ Rebalance completed successfully")
         trade_logger.info(f"[{request.user.username}] Result summary:")
@@ -606,7 +533,7 @@ def manual_rebalance(request):
         error_data = {"error": str(e), "trace": traceback.format_exc()}
 
         session.last_rebalance_result = error_data
-        session.save()
+        session.save(update_fields=['last_rebalance_result'])
 
         TradeHistory.objects.create(
             user=user,
@@ -654,7 +581,8 @@ def update_default_interval(request):
 
         if session.is_running:
             session.next_run_time = timezone.now() + timedelta(seconds=profile.default_interval)
-            session.save(update_fields=['next_run_time'])
+            session.save(update_fields=['next_run_time', 'updated_at'])
+            notify_rebalancer()
 
         return JsonResponse({"status": "ok", "default_interval": profile.default_interval})
     except Exception as e:
@@ -687,7 +615,10 @@ def set_next_rebalance_time(request):
 
         total_seconds = days * 86400 + hours * 3600 + minutes * 60 + seconds
         session.next_run_time = timezone.now() + timedelta(seconds=total_seconds)
-        session.save()
+        session.save(update_fields=['next_run_time', 'updated_at'])
+
+        if session.is_running:
+            notify_rebalancer()
 
         return JsonResponse({
             "status": "ok",
@@ -720,7 +651,7 @@ def toggle_dry_run(request):
     else:
         session.dry_run_mode = not session.dry_run_mode
 
-    session.save()
+    session.save(update_fields=['dry_run_mode'])
 
     return JsonResponse({
         'status': 'ok',
@@ -1138,6 +1069,9 @@ def trading_settings_view(request):
             profile.cmc_index_type = request.POST.get('cmc_index_type', 'CMC20')
             profile.min_trade_threshold = float(request.POST.get('min_trade_threshold', 5.0))
             profile.auto_convert_dust = request.POST.get('auto_convert_dust') == 'on'
+            profile.drift_band_enabled = request.POST.get('drift_band_enabled') == 'on'
+            profile.drift_band_absolute = float(request.POST.get('drift_band_absolute', 5.0))
+            profile.drift_band_relative = float(request.POST.get('drift_band_relative', 25.0))
 
             # NEW: Handle exchange selection, testnet and proxy settings
             profile.binance_exchange = request.POST.get('binance_exchange', 'com')
@@ -0,0 +1,264 @@
+"""
+Shared index target allocations.
+
+Every user on the same index configuration gets the same target weights
+from the same CMC listings, so AllocationService computes them once per
+(index configuration, listings snapshot) and publishes the result as an
+immutable, versioned TargetAllocation.  A trader only multiplies the
+weights by its own portfolio value:
+
+    allocation = allocation_service.btc_eth(api_key, 20, stablecoins)
+    allocation.targets(total_portfolio_value)   # {'BTC': 612.3, 'ETH': 387.7}
+
+CMC requests themselves are shared by the listings cache, so both CMC
+traffic and allocation work scale with the number of distinct index
+configurations rather than with the number of users.  Weights come from
+MarketCapTable, which lays the listings out as columns with a running
+market-cap sum and computes every top-N index of a base in one pass.
+"""
+import time
+import logging
+import itertools
+import threading
+from dataclasses import dataclass, field
+from types import MappingProxyType
+
+from trader.cmc_cache import listings_cache
+
+api_logger = logging.getLogger('api')
+
+# index_base -> (coins fetched to cover stablecoins, base size, {index_type: selected count})
+INDEX_BASES = {
+    'cmc20': (50, 20, {'top2': 2, 'top5': 5, 'top10': 10, 'top20': 20}),
+    'cmc100': (150, 100, {
+        'top30': 30, 'top40': 40, 'top50': 50, 'top60': 60,
+        'top70': 70, 'top80': 80, 'top90': 90, 'top100': 100
+    }),
+}
+
+# Extra coins fetched for the BTC/ETH index to make up for removed stablecoins
+BTC_ETH_FETCH_MARGIN = 30
+
+
+class MarketCapTable:
+    """
+    Non-stable coins of one listings response as contiguous columns.
+
+    Market caps are laid out once together with their running sum, so the
+    base total, the selected weights and the redistribution bonus of any
+    top-N index are a lookup into the running sum instead of a walk over
+    nested coin dicts:
+
+        table = MarketCapTable(coins, stablecoins)
+        table.allocate(20, [2, 5, 10, 20])     # every CMC20 index type at once
+    """
+
+    def __init__(self, coins: list, stablecoins=()):
+        kept = [coin for coin in coins if coin['symbol'] not in stablecoins]
+        quotes = [coin['quote']['USD'] for coin in kept]
+
+        self.symbols = [coin['symbol'] for coin in kept]
+        self.names = [coin['name'] for coin in kept]
+        self.position = {symbol: i for i, symbol in reversed(list(enumerate(self.symbols)))}
+
+        self.market_cap = [float(q['market_cap']) for q in quotes]
+        self.rank = [coin['cmc_rank'] for coin in kept]
+        self.price = [q['price'] for q in quotes]
+        self.change_24h = [q['percent_change_24h'] for q in quotes]
+        self.cumulative = list(itertools.accumulate(self.market_cap))
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def _total(self, base_size: int) -> float:
+        base = min(base_size, len(self))
+        return self.cumulative[base - 1] if base else 0.0
+
+    def _entries(self, positions, original_weights, bonus: float, total_market_cap: float) -> dict:
+        return {
+            self.symbols[i]: {
+                'rank': int(self.rank[i]),
+                'name': self.names[i],
+                'original_weight': original,
+                'redistribution_bonus': bonus,
+                'weight': original + bonus,
+                'market_cap': float(self.market_cap[i]),
+                'price': float(self.price[i]),
+                'change_24h': float(self.change_24h[i])
+            }
+            for i, original in zip(positions, original_weights)
+        }
+
+    def allocate(self, base_size: int, selected_counts) -> dict:
+        """
+        Weights of the top-N coins of a `base_size` index for every N in
+        `selected_counts`, the rest of the base redistributed equally.
+
+        Returns:
+            {N: ({symbol: entry}, total market cap)}; empty if the base is empty
+        """
+        base = min(base_size, len(self))
+        total = self._total(base)
+        if not total:
+            return {}
+
+        counts = sorted({min(count, base) for count in selected_counts if count > 0})
+        bonuses = [(total - self.cumulative[count - 1]) / total * 100 / count for count in counts]
+        original = [market_cap / total * 100 for market_cap in self.market_cap[:base]]
+
+        by_count = {
+            count: (self._entries(range(count), original[:count], bonus, total), total)
+            for count, bonus in zip(counts, bonuses)
+        }
+        return {count: by_count[min(count, base)] for count in selected_counts if count > 0}
+
+    def allocate_symbols(self, index_size: int, symbols) -> tuple:
+        """
+        Weights of fixed `symbols` within the top `index_size` coins, the
+        rest of the index split equally between them.
+
+        Returns:
+            ({symbol: entry}, total market cap), or None if a symbol is not in the index
+        """
+        total = self._total(index_size)
+        positions = [self.position.get(symbol) for symbol in symbols]
+        if not total or any(i is None or i >= index_size for i in positions):
+            return None
+
+        caps = [self.market_cap[i] for i in positions]
+        original = [market_cap / total * 100 for market_cap in caps]
+        selected_market_cap = sum(caps)
+
+        bonus = (total - selected_market_cap) / total * 100 / len(positions)
+        return self._entries(positions, original, bonus, total), total
+
+
+@dataclass(frozen=True)
+class TargetAllocation:
+    """Target weights of one index configuration from one CMC listings snapshot"""
+    key: tuple                  # e.g. ('btc_eth', 'cmc20') or ('index', 'cmc20', 'top5')
+    version: int                # increases with every new listings snapshot for the key
+    snapshot_at: float          # fetch time of the CMC listings used
+    coins: MappingProxyType     # symbol -> read-only allocation entry
+    total_market_cap: float
+    selected_count: int
+    base_size: int
+    computed_at: float = field(default_factory=time.time)
+
+    @property
+    def tag(self) -> str:
+        """Printable identity, recorded in rebalance results"""
+        return f"{'/'.join(str(part) for part in self.key)}@v{self.version}"
+
+    @property
+    def weights(self) -> dict:
+        """{symbol: weight in percent}"""
+        return {symbol: entry['weight'] for symbol, entry in self.coins.items()}
+
+    def targets(self, total_value: float) -> dict:
+        """{symbol: target value} for a portfolio of `total_value`"""
+        return {symbol: total_value * entry['weight'] / 100 for symbol, entry in self.coins.items()}
+
+    def as_dict(self) -> dict:
+        """Mutable copy in the shape the planner expects (it adds 'target_value')"""
+        return {symbol: dict(entry) for symbol, entry in self.coins.items()}
+
+
+class AllocationService:
+    """Computes each index allocation once per listings snapshot and publishes it"""
+
+    def __init__(self, cache=None):
+        self.cache = cache or listings_cache
+        self._published = {}   # (key, stablecoins) -> (listings it was computed from, TargetAllocation)
+        self._lock = threading.Lock()
+        self.computations = 0
+        self.reuses = 0
+
+    def _current(self, key, stablecoins: frozenset, coins):
+        # The listings cache returns the same list object until it refreshes,
+        # so identity tells whether the published allocation is still current
+        published = self._published.get((key, stablecoins))
+        if published is not None and published[0] is coins:
+            return published[1]
+        return None
+
+    def _publish(self, key, stablecoins: frozenset, coins, snapshot_at: float, result,
+                 selected_count: int, base_size: int):
+        entries, total_market_cap = result
+        previous = self._published.get((key, stablecoins))
+        allocation = TargetAllocation(
+            key=key,
+            version=previous[1].version + 1 if previous is not None else 1,
+            snapshot_at=snapshot_at,
+            coins=MappingProxyType({symbol: MappingProxyType(entry) for symbol, entry in entries.items()}),
+            total_market_cap=total_market_cap,
+            selected_count=selected_count,
+            base_size=base_size,
+        )
+        self._published[(key, stablecoins)] = (coins, allocation)
+        self.computations += 1
+        api_logger.info(f"Target allocation published: {allocation.tag} ({len(allocation.coins)} coins)")
+        return allocation
+
+    def btc_eth(self, api_key: str, index_size: int, stablecoins=()):
+        """BTC/ETH allocation of the top `index_size` index, or None if BTC or ETH is missing"""
+        stablecoins = frozenset(stablecoins)
+        key = ('btc_eth', f"cmc{index_size}")
+        limit = index_size + BTC_ETH_FETCH_MARGIN
+        coins = self.cache.get(api_key, limit)
+
+        with self._lock:
+            allocation = self._current(key, stablecoins, coins)
+            if allocation is not None:
+                self.reuses += 1
+                return allocation
+
+            result = MarketCapTable(coins, stablecoins).allocate_symbols(index_size, ('BTC', 'ETH'))
+            if result is None:
+                return None
+            return self._publish(key, stablecoins, coins, self.cache.fetched_at(limit), result, 2, index_size)
+
+    def index(self, api_key: str, index_base: str, index_type: str, stablecoins=()):
+        """Allocation of an index_base/index_type pair such as ('cmc20', 'top5')"""
+        limit, base_size, index_map = INDEX_BASES[index_base]
+        selected_count = index_map.get(index_type, 2)
+        stablecoins = frozenset(stablecoins)
+        key = ('index', index_base, f"top{selected_count}")
+        coins = self.cache.get(api_key, limit)
+
+        with self._lock:
+            allocation = self._current(key, stablecoins, coins)
+            if allocation is not None:
+                self.reuses += 1
+                return allocation
+
+            # One pass over the listings publishes every index type of the base
+            counts = set(index_map.values()) | {selected_count}
+            results = MarketCapTable(coins, stablecoins).allocate(base_size, counts)
+            snapshot_at = self.cache.fetched_at(limit)
+            for count, result in results.items():
+                self._publish(('index', index_base, f"top{count}"), stablecoins, coins, snapshot_at,
+                              result, count, base_size)
+            return self._current(key, stablecoins, coins)
+
+    def peek_btc_eth(self, index_size: int, stablecoins=()):
+        """Last published BTC/ETH allocation without touching CMC or the listings cache, or None"""
+        with self._lock:
+            published = self._published.get((('btc_eth', f"cmc{index_size}"), frozenset(stablecoins)))
+            return published[1] if published is not None else None
+
+    def latest(self):
+        """Published allocations: {tag: TargetAllocation}"""
+        with self._lock:
+            return {allocation.tag: allocation for _, allocation in self._published.values()}
+
+    def stats(self) -> dict:
+        return {
+            'published': len(self._published),
+            'computations': self.computations,
+            'reuses': self.reuses,
+        }
+
+
+# Shared by all traders in this process
+allocation_service = AllocationService()
@@ -1,13 +1,29 @@
 import os
 import time
-import requests
 import logging
+import threading
 import traceback
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from binance.client import Client
 from binance.exceptions import BinanceAPIException
 
+from trader.market_data import PriceSnapshot, ExchangeInfoCache, ExchangeInfoUnavailable, RoutingTable
+from trader.cmc_cache import listings_cache, CoinMarketCapError, CMC_LISTINGS_URL
+from trader.allocation import allocation_service
+from trader.planner import (CROSS_PAIR_ROUTING, TRADING_FEE_RATE, max_cross_flows, movable_value, plan_cost,
+                            select_quote_currency)
+from trader.drift import DRIFT_TARGET_MAX_AGE, DriftBands, measure_drift
+from trader.http_sessions import proxy_url_from_config
+from trader.client_pool import client_pool
+from trader.clock_sync import ClockSynchronizer, handle_api_error
+from trader.price_feed import MarketDataFeed
+from trader.user_stream import UserDataStream
+from trader.execution import (
+    ORDER_PARALLELISM, RECONCILE_AFTER_REBALANCE, BalanceLedger, QuoteBudget,
+    order_limiter_for, order_limits_from_exchange_info
+)
+
 load_dotenv()
 
 # Get specialized loggers
@@ -26,13 +42,15 @@ class BTCETH_CMC20_Trader:
                  cmc_api_key=None, update_interval=None,
                  index_type='CMC20', min_trade_threshold=5.0,
                  auto_convert_dust=True, use_testnet=False,
-                 proxy_config=None, binance_tld='com'):
+                 proxy_config=None, binance_tld='com',
+                 index_base='cmc20', index_selection='top2'):
         """
         Initialize trader with index configuration
 
         Args:
-            index_type: 'top2', 'top5', ..., 'top100'
-            index_base: 'cmc20' or 'cmc100'
+            index_type: 'CMC20' or 'CMC100' (BTC/ETH rebalancing)
+            index_base: 'cmc20' or 'cmc100' (index distribution)
+            index_selection: 'top2', 'top5', ..., 'top100' (index distribution)
             use_testnet: Use Binance Testnet instead of production
             proxy_config: Dict with proxy settings {'host', 'port', 'user', 'password'}
             binance_tld: 'com' for Binance.com (international) or 'us' for Binance.US
@@ -46,30 +64,19 @@ class BTCETH_CMC20_Trader:
         if not self.binance_api_key or not self.binance_api_secret:
             raise ValueError("Binance API credentials required")
 
-        # Configure client options based on testnet and proxy settings
-        client_options = {}
-
-        # Set up proxy if provided
-        if proxy_config and proxy_config.get('host') and proxy_config.get('port'):
-            proxy_url = f"socks5://{proxy_config['host']}:{proxy_config['port']}"
-
-            # Add authentication if provided
-            if proxy_config.get('user') and proxy_config.get('password'):
-                proxy_url = f"socks5://{proxy_config['user']}:{proxy_config['password']}@{proxy_config['host']}:{proxy_config['port']}"
-
-            client_options['proxies'] = {
-                'http': proxy_url,
-                'https': proxy_url
-            }
+        # Timeouts and optional SOCKS5 proxy for every Binance request
+        proxy_url = proxy_url_from_config(proxy_config)
+        self.proxy_url = proxy_url
+        if proxy_url:
             debug_logger.info(f"Using SOCKS5 proxy: {proxy_config['host']}:{proxy_config['port']}")
 
-        # Initialize Binance client with testnet flag, TLD, and proxy
-        self.client = Client(
+        # Warm client from the process-wide pool (new clients ping the exchange)
+        self.client, _ = client_pool.acquire(
             self.binance_api_key,
             self.binance_api_secret,
+            tld=binance_tld,
             testnet=use_testnet,
-            tld=binance_tld if not use_testnet else 'com',  # Testnet only works with .com
-            requests_params=client_options if client_options else None
+            proxy_url=proxy_url
         )
 
         if use_testnet:
@@ -78,21 +85,15 @@ class BTCETH_CMC20_Trader:
             exchange_name = "Binance.US" if binance_tld == 'us' else "Binance.com"
             debug_logger.info(f"Using {exchange_name} Production")
 
-        try:
-            server_time = self.client.get_server_time()
-            local_time = int(time.time() * 1000)
-            time_offset = server_time['serverTime'] - local_time
-            self.client.timestamp_offset = time_offset
-        except Exception as e:
-            debug_logger.warning(f"Failed to sync timestamp: {e}")
-
             # New configuration
         self.index_type = index_type  # 'CMC20' or 'CMC100'
+        self.index_base = index_base  # 'cmc20' or 'cmc100'
+        self.index_selection = index_selection  # 'top2' ... 'top100'
         self.min_trade_threshold = min_trade_threshold
         self.auto_convert_dust = auto_convert_dust
 
         self.cmc_api_key = cmc_api_key or os.getenv("COINMARKETCAP_API_KEY")
-        self.cmc_api_url = "https://pro-api.coinmarketcap.com/v1/cryptocurrency/listings/latest"
+        self.cmc_api_url = CMC_LISTINGS_URL
         self.update_interval = update_interval or int(os.getenv("CMC_INDEX_UPDATE_INTERVAL", 3600))
 
         self.stablecoins = ['USDT', 'USDC', 'BUSD', 'FDUSD', 'USDe', 'DAI', 'TUSD', 'USDP', 'USDD', 'GUSD', 'PYUSD']
@@ -100,22 +101,38 @@ class BTCETH_CMC20_Trader:
         api_logger.info(
             f"Trader initialized: index={self.index_type}, threshold=${self.min_trade_threshold}, auto_convert={self.auto_convert_dust}")
 
-        # Synchronize timestamp with Binance server to avoid timestamp errors
-        try:
-            debug_logger.info("Synchronizing timestamp with Binance server...")
-            server_time = self.client.get_server_time()
-            local_time = int(time.time() * 1000)
-            time_offset = server_time['serverTime'] - local_time
-            self.client.timestamp_offset = time_offset
-            debug_logger.info(f"Timestamp synchronized. Offset: {time_offset}ms")
-        except Exception as e:
-            debug_logger.warning(f"Failed to synchronize timestamp: {e}. Continuing without sync.")
+        # Timestamp offset is measured in the background and shared by all
+        # clients of this endpoint - no server-time calls per trader
+        ClockSynchronizer.shared(self.client).register(self.client)
 
         debug_logger.info("Binance client created successfully")
 
+        # Exchange filters are shared by every trader on the same endpoint
+        self.exchange_info = ExchangeInfoCache.shared(self.client)
+        self.routing = RoutingTable.shared(self.client)
+        self.last_price_snapshot = None
+        # Shared TargetAllocation used by the latest cycle (see trader.allocation)
+        self.last_target_allocation = None
+        # (balances, total) valued by the latest probe_drift()
+        self.last_drift_portfolio = None
+
+        # Streaming price book (None if streaming is disabled/unavailable). The stream
+        # would not use the account's SOCKS5 proxy, so proxied accounts price over REST
+        self.price_feed = MarketDataFeed.shared(self.client) if not self.proxy_url else None
+        if self.price_feed is not None:
+            self.price_feed.start()
+
+        # Account balances pushed by the user data stream (see start_user_stream)
+        self.user_stream = None
+
+        # Wake-ups for run_continuous_rebalance (stop / reschedule without waiting out the interval)
+        self._wakeup = threading.Event()
+        self._stop_requested = threading.Event()
+        self._next_run_override = None
+
         # CoinMarketCap API - use provided or fall back to .env
         self.cmc_api_key = cmc_api_key or os.getenv("COINMARKETCAP_API_KEY")
-        self.cmc_api_url = "https://pro-api.coinmarketcap.com/v1/cryptocurrency/listings/latest"
+        self.cmc_api_url = CMC_LISTINGS_URL
         self.update_interval = update_interval or int(os.getenv("CMC_INDEX_UPDATE_INTERVAL", 3600))
 
         # Список стейблкоїнів для виключення
@@ -134,13 +151,109 @@ class BTCETH_CMC20_Trader:
             print(f"❌ Помилка отримання балансу: {e}")
             return 0.0
 
-    def get_all_binance_balances(self) -> dict:
-        """Отримує всі баланси на Binance з вартістю в USDC"""
+    def get_price_snapshot(self) -> PriceSnapshot:
+        """Отримує ціни всіх символів: з потоку, або одним REST-запитом"""
+        if self.price_feed is not None and not self.price_feed.is_stale:
+            self.last_price_snapshot = self.price_feed.book.snapshot()
+        else:
+            self.last_price_snapshot = PriceSnapshot.fetch(self.client)
+        return self.last_price_snapshot
+
+    def _snapshot_pricing(self, snapshot: PriceSnapshot, assets) -> PriceSnapshot:
+        """
+        Snapshot that can price every one of `assets`
+
+        A stream snapshot only holds symbols seen since the feed connected;
+        if it misses a tradable asset, one REST snapshot replaces it.
+        """
+        if snapshot is None:
+            snapshot = self.get_price_snapshot()
+        if snapshot.source != 'stream':
+            return snapshot
+        missing = [
+            asset for asset in assets
+            if asset not in self.stablecoins and not snapshot.usd_price(asset, self.stablecoins)
+            and (not self.routing.loaded or self.routing.quotes(asset))
+        ]
+        if missing:
+            api_logger.info(f"Stream prices missing for {missing}, taking a REST snapshot")
+            snapshot = PriceSnapshot.fetch(self.client)
+        self.last_price_snapshot = snapshot
+        return snapshot
+
+    def start_user_stream(self) -> bool:
+        """Підписується на user data stream акаунта; False якщо стрім недоступний"""
+        if self.proxy_url:
+            # The stream would connect from the host IP, bypassing the account's proxy
+            return False
+        self.user_stream = UserDataStream.shared(self.client)
+        if self.user_stream is None:
+            return False
+        self.user_stream.start()
+        return True
+
+    def stop_user_stream(self):
+        if self.user_stream is not None:
+            self.user_stream.stop()
+            self.user_stream = None
+
+    def get_cached_balances(self):
+        """
+        Баланси з пам'яті: user data stream + потік цін, без жодного запиту
+
+        Returns:
+            (balances, total) or None if either stream is not live
+        """
+        if self.user_stream is None or not self.user_stream.is_live:
+            return None
+        if self.price_feed is None or self.price_feed.is_stale:
+            return None
+
+        held = self.user_stream.book.balances()
+        snapshot = self.price_feed.book.snapshot()
+        if any(not snapshot.usd_price(asset, self.stablecoins) for asset in held if asset not in self.stablecoins):
+            # A quiet symbol not seen since the feed connected - value via REST instead
+            return None
+
+        self.last_price_snapshot = snapshot
+        balances = {}
+        total_portfolio_usdc = 0.0
+        for asset, data in held.items():
+            if asset in self.stablecoins:
+                usdc_value = data['total']
+            else:
+                usdc_value = snapshot.value(asset, data['total'], self.stablecoins)
+            balances[asset] = dict(data, usdc_value=usdc_value)
+            total_portfolio_usdc += usdc_value
+        return balances, total_portfolio_usdc
+
+    def get_all_binance_balances(self, snapshot: PriceSnapshot = None) -> dict:
+        """
+        Отримує всі баланси на Binance з вартістю в USDC
+
+        Args:
+            snapshot: prices to value the account with (a fresh one is taken if needed)
+        """
         api_logger.info("Fetching all Binance balances...")
         try:
-            account = self.client.get_account()
+            if self.user_stream is not None and self.user_stream.is_live:
+                # Quantities are already in memory
+                account = {'balances': [
+                    {'asset': asset, 'free': data['free'], 'locked': data['locked']}
+                    for asset, data in self.user_stream.book.balances().items()
+                ]}
+            else:
+                account = self.client.get_account()
             balances = {}
             total_portfolio_usdc = 0.0
+            # Taken lazily, once, for all non-stable assets unless the cycle passed one;
+            # completed from REST if the stream has not seen one of the held assets
+            held = [
+                balance['asset'] for balance in account['balances']
+                if float(balance['free']) + float(balance['locked']) > 0 and balance['asset'] not in self.stablecoins
+            ]
+            if held:
+                snapshot = self._snapshot_pricing(snapshot, held)
 
             print("\n💼 Поточні баланси на Binance:")
             print("-" * 90)
@@ -154,27 +267,10 @@ class BTCETH_CMC20_Trader:
                     asset = balance['asset']
 
                     # Розраховуємо вартість в USDC
-                    usdc_value = 0.0
                     if asset in self.stablecoins:
                         usdc_value = total
                     else:
-                        try:
-                            ticker = self.client.get_symbol_ticker(symbol=f"{asset}USDC")
-                            price = float(ticker['price'])
-                            usdc_value = total * price
-                        except:
-                            try:
-                                ticker = self.client.get_symbol_ticker(symbol=f"{asset}USDT")
-                                price = float(ticker['price'])
-                                usdc_value = total * price
-                            except:
-                                try:
-                                    ticker_btc = self.client.get_symbol_ticker(symbol=f"{asset}BTC")
-                                    btc_price = float(ticker_btc['price'])
-                                    btc_usdc = float(self.client.get_symbol_ticker(symbol="BTCUSDC")['price'])
-                                    usdc_value = total * btc_price * btc_usdc
-                                except:
-                                    usdc_value = 0.0
+                        usdc_value = snapshot.value(asset, total, self.stablecoins)
 
                     balances[asset] = {
                         'free': free,
@@ -197,11 +293,16 @@ class BTCETH_CMC20_Trader:
             return balances, total_portfolio_usdc
 
         except BinanceAPIException as e:
+            handle_api_error(self.client, e)
             error_logger.error(f"Binance API error fetching balances: {e}")
             error_logger.error(traceback.format_exc())
             print(f"❌ Помилка отримання балансів: {e}")
             return {}, 0.0
 
+    def get_cmc_listings(self, limit: int, convert: str = 'USD') -> list:
+        """CMC listings from the process-wide cache (one API call per TTL for all users)"""
+        return listings_cache.get(self.cmc_api_key, limit, convert)
+
     def get_allocation_from_cmc(self) -> dict:
         """
         Get allocation based on selected index base and type
@@ -210,101 +311,34 @@ class BTCETH_CMC20_Trader:
         Returns:
             dict: Allocation data for selected coins
         """
-        api_logger.info(f"Fetching {self.index_base.upper()} allocation for {self.index_type}")
-
         try:
-            headers = {
-                'X-CMC_PRO_API_KEY': self.cmc_api_key,
-                'Accept': 'application/json'
-            }
-
-            # Determine how many coins to fetch based on base
-            limit = 50 if self.index_base == 'cmc20' else 150
-
-            params = {
-                'start': '1',
-                'limit': str(limit),
-                'convert': 'USD'
-            }
-
-            api_logger.debug(f"Calling CoinMarketCap API with limit={limit}")
-            response = requests.get(self.cmc_api_url, headers=headers, params=params)
-            data = response.json()
-
-            if response.status_code != 200:
-                error_msg = data.get('status', {}).get('error_message', 'Unknown error')
-                error_logger.error(f"CoinMarketCap API error: {error_msg}")
+            api_logger.info(f"Fetching {self.index_base.upper()} allocation for {self.index_selection}")
+            allocation = allocation_service.index(
+                self.cmc_api_key, self.index_base, self.index_selection, self.stablecoins
+            )
+            if allocation is None:
+                error_logger.error(f"No {self.index_base.upper()} listings to allocate")
                 return {}
+            self.last_target_allocation = allocation
 
-            coins = data['data']
-
-            # Remove all stablecoins
-            coins = [coin for coin in coins if coin['symbol'] not in self.stablecoins]
-
-            # Determine base limit and selected count
-            if self.index_base == 'cmc20':
-                base_limit = 20
-                index_map = {
-                    'top2': 2, 'top5': 5, 'top10': 10, 'top20': 20
-                }
-            else:  # cmc100
-                base_limit = 100
-                index_map = {
-                    'top30': 30, 'top40': 40, 'top50': 50, 'top60': 60,
-                    'top70': 70, 'top80': 80, 'top90': 90, 'top100': 100
-                }
-
-            selected_count = index_map.get(self.index_type, 2)
-
-            # Get coins within base limit
-            base_coins = coins[:base_limit]
-
-            # Calculate total market cap of base coins
-            total_market_cap = sum(coin['quote']['USD']['market_cap'] for coin in base_coins)
-
-            # Get selected coins
-            selected_coins = base_coins[:selected_count]
-            remaining_coins = base_coins[selected_count:]
-
-            # Calculate market caps
-            selected_market_cap = sum(coin['quote']['USD']['market_cap'] for coin in selected_coins)
-            remaining_market_cap = sum(coin['quote']['USD']['market_cap'] for coin in remaining_coins)
-
-            # Calculate redistribution per selected coin
-            redistribution_per_coin = (remaining_market_cap / total_market_cap * 100) / selected_count
-
-            # Build allocation data
-            allocation_data = {}
+            selected_count = allocation.selected_count
+            total_market_cap = allocation.total_market_cap
+            redistribution_per_coin = next(iter(allocation.coins.values()))['redistribution_bonus']
+            allocation_data = allocation.as_dict()
 
             print(f"\n{'=' * 80}")
-            print(f"🔍 INDEX DISTRIBUTION: {self.index_base.upper()} - {self.index_type.upper()}")
+            print(f"🔍 INDEX DISTRIBUTION: {self.index_base.upper()} - {self.index_selection.upper()}")
             print(f"{'=' * 80}")
             print(f"   📊 Total {self.index_base.upper()} market cap: ${total_market_cap:,.0f}")
             print(f"   🎯 Selected coins: {selected_count}")
-            print(f"   📦 Remaining coins in base: {len(remaining_coins)}")
+            print(f"   📦 Remaining coins in base: {allocation.base_size - len(allocation_data)}")
             print(f"   ➗ Redistribution per coin: +{redistribution_per_coin:.4f}%")
             print(f"{'=' * 80}\n")
 
-            for coin in selected_coins:
-                symbol = coin['symbol']
-                market_cap = coin['quote']['USD']['market_cap']
-                original_weight = (market_cap / total_market_cap) * 100
-                final_weight = original_weight + redistribution_per_coin
-
-                allocation_data[symbol] = {
-                    'rank': coin['cmc_rank'],
-                    'name': coin['name'],
-                    'original_weight': original_weight,
-                    'redistribution_bonus': redistribution_per_coin,
-                    'weight': final_weight,
-                    'market_cap': market_cap,
-                    'price': coin['quote']['USD']['price'],
-                    'change_24h': coin['quote']['USD']['percent_change_24h']
-                }
-
-                print(f"   #{coin['cmc_rank']:2d} {symbol:8s}: "
-                      f"{original_weight:6.2f}% + {redistribution_per_coin:6.2f}% = "
-                      f"{final_weight:6.2f}%")
+            for symbol, data in allocation_data.items():
+                print(f"   #{data['rank']:2d} {symbol:8s}: "
+                      f"{data['original_weight']:6.2f}% + {redistribution_per_coin:6.2f}% = "
+                      f"{data['weight']:6.2f}%")
 
             # Verify total is 100%
             total_weight = sum(data['weight'] for data in allocation_data.values())
@@ -312,11 +346,14 @@ class BTCETH_CMC20_Trader:
             print(f"   ✅ Total weight: {total_weight:.4f}% (should be ≈100%)")
             print(f"   {'=' * 76}\n")
 
-            api_logger.info(f"Successfully calculated {self.index_base.upper()} - {self.index_type} allocation")
+            api_logger.info(f"Successfully calculated {self.index_base.upper()} - {self.index_selection} allocation")
             api_logger.info(f"Selected {len(allocation_data)} coins with total weight: {total_weight:.2f}%")
 
             return allocation_data
 
+        except CoinMarketCapError as e:
+            error_logger.error(f"CoinMarketCap API error: {e}")
+            return {}
         except Exception as e:
             error_logger.error(f"Error fetching {self.index_base.upper()} allocation: {e}")
             error_logger.error(traceback.format_exc())
@@ -328,7 +365,7 @@ class BTCETH_CMC20_Trader:
         Works with both CMC20 and CMC100
         """
         print("\n" + "=" * 120)
-        print(f"📈 PORTFOLIO ALLOCATION ({self.index_base.upper()} - {self.index_type.upper()})")
+        print(f"📈 PORTFOLIO ALLOCATION ({self.index_base.upper()} - {self.index_selection.upper()})")
         print("=" * 120)
 
         allocation_data = self.get_allocation_from_cmc()
@@ -435,37 +472,113 @@ class BTCETH_CMC20_Trader:
         print(f"📊 Загальна різниця для ребалансування: ${total_difference / 2:,.2f}")
         print("=" * 120 + "\n")
 
-    def get_binance_price(self, symbol: str) -> float:
-        """Отримує поточну ціну токена на Binance"""
+    def _ensure_routing(self):
+        """Loads exchange metadata once and keeps it fresh in the background"""
         try:
-            pair = f"{symbol}USDC"
-            ticker = self.client.get_symbol_ticker(symbol=pair)
-            return float(ticker['price'])
-        except BinanceAPIException:
-            try:
-                pair = f"{symbol}USDT"
-                ticker = self.client.get_symbol_ticker(symbol=pair)
-                return float(ticker['price'])
-            except BinanceAPIException as e:
-                print(f"❌ Не вдалося отримати ціну {symbol}: {e}")
-                return 0.0
+            self.exchange_info.ensure_fresh(self.client)
+            self.exchange_info.start_background_refresh(self.client)
+            # 24h volumes only rank quotes of equal preference; refreshed once per TTL
+            self.routing.refresh_liquidity(self.client)
+        except Exception as e:
+            error_logger.error(f"Failed to load exchange info: {e}")
+
+    def get_binance_price(self, symbol: str, snapshot: PriceSnapshot = None) -> float:
+        """
+        Отримує поточну ціну токена на Binance
+
+        Prices come from `snapshot` when given (the cycle's price snapshot),
+        otherwise from the streaming book; REST only for legs missing from both.
+        """
+        self._ensure_routing()
+        route = self.routing.route(symbol)
+        if route is not None:
+            legs = route.legs
+        elif not self.routing.loaded:
+            # Exchange metadata unavailable - fall back to the USDC pair
+            legs = (f"{symbol}USDC",)
+        else:
+            print(f"❌ Не вдалося отримати ціну {symbol}: немає торгової пари")
+            return 0.0
+
+        try:
+            price = 1.0
+            for pair in legs:
+                if snapshot is not None:
+                    leg_price = snapshot.get(pair)
+                else:
+                    leg_price = self.price_feed.book.get(pair) if self.price_feed is not None else None
+                if leg_price is None:
+                    # Stream down or stale - fall back to REST
+                    leg_price = float(self.client.get_symbol_ticker(symbol=pair)['price'])
+                price *= leg_price
+            return price
+        except BinanceAPIException as e:
+            print(f"❌ Не вдалося отримати ціну {symbol}: {e}")
+            return 0.0
 
     def get_trading_pair(self, symbol: str) -> str:
         """Визначає доступну торгову пару"""
-        try:
-            pair = f"{symbol}USDC"
-            self.client.get_symbol_ticker(symbol=pair)
-            return "USDC"
-        except BinanceAPIException:
-            try:
-                pair = f"{symbol}USDT"
-                self.client.get_symbol_ticker(symbol=pair)
-                return "USDT"
-            except BinanceAPIException:
-                return None
+        self._ensure_routing()
+        return self.routing.direct_quote(symbol, ('USDC', 'USDT'))
+
+    def can_place_market_order(self, pair: str, quantity: float, value: float) -> tuple:
+        """
+        Перевіряє, чи можна виставити market order, без жодного запиту до API
+
+        Uses only the cached exchange filters and the last price snapshot.
+
+        Returns:
+            (can_place, reason, details) where details contains
+            'adjusted_quantity' (floored to the step size) and 'notional'
+        """
+        details = {'adjusted_quantity': 0.0, 'notional': 0.0}
+
+        filters = self.exchange_info.peek(pair)
+        if filters is None:
+            return False, 'symbol_not_found', details
+        if not filters.is_trading:
+            return False, 'not_trading', details
+
+        adjusted_quantity = filters.round_quantity(quantity)
+
+        price = None
+        if self.last_price_snapshot is not None:
+            price = self.last_price_snapshot.get(pair)
+        if not price and quantity > 0:
+            price = value / quantity
+        notional = adjusted_quantity * (price or 0.0)
+
+        details.update({
+            'adjusted_quantity': adjusted_quantity,
+            'notional': notional,
+            'min_qty': filters.market_min_qty or filters.min_qty,
+            'min_notional': filters.min_notional,
+        })
+
+        min_qty = filters.market_min_qty or filters.min_qty
+        max_qty = filters.market_max_qty or filters.max_qty
+
+        if adjusted_quantity <= 0 or adjusted_quantity < min_qty:
+            return False, 'below_min_qty', details
+        if max_qty and adjusted_quantity > max_qty:
+            return False, 'above_max_qty', details
+        if filters.min_notional_applies_to_market and notional < filters.min_notional:
+            return False, 'below_min_notional', details
+
+        return True, 'ok', details
 
     def execute_market_order(self, symbol: str, side: str, quantity: float, quote_currency: str = "USDC",
                              dry_run: bool = False) -> bool:
+        return self.place_market_order(symbol, side, quantity, quote_currency, dry_run) is not None
+
+    def place_market_order(self, symbol: str, side: str, quantity: float, quote_currency: str = "USDC",
+                           dry_run: bool = False):
+        """
+        Виставляє MARKET ордер
+
+        Returns:
+            FULL order response (with fills), {} in dry run, None on failure
+        """
         trade_logger.info(f"{'='*60}")
         trade_logger.info(f"MARKET ORDER: {side} {quantity:.8f} {symbol} for {quote_currency}")
         trade_logger.info(f"Dry run: {dry_run}")
@@ -473,33 +586,24 @@ class BTCETH_CMC20_Trader:
             if dry_run:
                 trade_logger.info(f"[DRY RUN] Would execute MARKET {side} {quantity} {symbol}")
                 print(f"[DRY RUN] MARKET {side} {quantity} {symbol}...")
-                return True
+                return {}
 
             pair = f"{symbol}{quote_currency}"
-            info = self.client.get_symbol_info(pair)
+            filters = self.exchange_info.get(self.client, pair)
 
-            if not info:
+            if not filters:
                 print(f"❌ Символ {pair} не знайдено")
-                return False
-
-            step_size = None
-
-            for f in info['filters']:
-                if f['filterType'] == 'LOT_SIZE':
-                    step_size = float(f['stepSize'])
-                    break
+                return None
 
-            if step_size:
-                precision = len(str(step_size).rstrip('0').split('.')[-1])
-                quantity = round(quantity, precision)
+            quantity = filters.round_quantity(quantity)
 
             print(f"📊 Виконується {'КУПІВЛЯ' if side == 'BUY' else 'ПРОДАЖ'} {quantity} {symbol} (MARKET ORDER)...")
             trade_logger.info(f"Executing {side} order for {pair}, quantity={quantity}")
 
             if side == 'BUY':
-                order = self.client.order_market_buy(symbol=pair, quantity=quantity)
+                order = self.client.order_market_buy(symbol=pair, quantity=quantity, newOrderRespType='FULL')
             else:
-                order = self.client.order_market_sell(symbol=pair, quantity=quantity)
+                order = self.client.order_market_sell(symbol=pair, quantity=quantity, newOrderRespType='FULL')
 
             trade_logger.info(f"[SUCCESS] Order executed successfully: {order['orderId']}")
             trade_logger.info(f"  Executed quantity: {order['executedQty']} {symbol}")
@@ -509,26 +613,36 @@ class BTCETH_CMC20_Trader:
             print(f"✅ Ордер виконано: {order['orderId']}")
             print(f"   {'Куплено' if side == 'BUY' else 'Продано'}: {order['executedQty']} {symbol}")
             print(f"   {'Витрачено' if side == 'BUY' else 'Отримано'}: {order['cummulativeQuoteQty']} {quote_currency}")
-            return True
+            return order
 
         except BinanceAPIException as e:
+            handle_api_error(self.client, e)
             error_logger.error(f"[ERROR] Binance API error for {side} {symbol}: {e}")
             error_logger.error(f"  Error code: {e.code if hasattr(e, 'code') else 'N/A'}")
             error_logger.error(traceback.format_exc())
             print(f"❌ Помилка ордеру {symbol}: {e}")
             print(f"   Error code: {e.code if hasattr(e, 'code') else 'N/A'}")
-            return False
+            return None
         except Exception as e:
             error_logger.error(f"[ERROR] Unknown error in market order {side} {symbol}: {e}")
             error_logger.error(traceback.format_exc())
             print(f"❌ Невідома помилка: {e}")
             traceback.print_exc()
-            return False
+            return None
         finally:
             trade_logger.info(f"{'='*60}")
 
     def execute_convert(self, from_asset: str, to_asset: str, amount: float, dry_run: bool = False) -> bool:
         """Виконує конвертацію через Binance Convert API"""
+        return self.place_convert(from_asset, to_asset, amount, dry_run) is not None
+
+    def place_convert(self, from_asset: str, to_asset: str, amount: float, dry_run: bool = False):
+        """
+        Виконує конвертацію через Binance Convert API
+
+        Returns:
+            {'fromAmount': float, 'toAmount': float or None} ({} in dry run), None on failure
+        """
         trade_logger.info(f"{'='*60}")
         trade_logger.info(f"CONVERT: {amount:.8f} {from_asset} → {to_asset}")
         trade_logger.info(f"Dry run: {dry_run}")
@@ -536,7 +650,7 @@ class BTCETH_CMC20_Trader:
             if dry_run:
                 trade_logger.info(f"[DRY RUN] Would convert {amount:.8f} {from_asset} → {to_asset}")
                 print(f"[DRY RUN] Конвертація {amount:.8f} {from_asset} → {to_asset}...")
-                return True
+                return {}
 
             print(f"🔄 Конвертація {amount:.8f} {from_asset} → {to_asset}...")
             trade_logger.info(f"Executing convert operation...")
@@ -563,11 +677,11 @@ class BTCETH_CMC20_Trader:
                         print(f"   Quote ID: {result['quoteId']}")
                         print(f"   Конвертовано: {amount} {from_asset}")
                         print(f"   Отримано: {result.get('toAmount', 'N/A')} {to_asset}")
-                        return True
+                        return self._convert_fill(result, amount)
                     else:
                         error_logger.error("Convert confirmation failed")
                         print(f"❌ Помилка підтвердження конвертації")
-                        return False
+                        return None
             except AttributeError:
                 # Варіант 2: Для старіших версій або альтернативного API
                 print("⚠️ convert_request_quote недоступний, пробуємо convert_asset...")
@@ -582,12 +696,13 @@ class BTCETH_CMC20_Trader:
                 print(f"   Order ID: {result['orderId']}")
                 print(f"   Конвертовано: {result.get('fromAmount', amount)} {from_asset}")
                 print(f"   Отримано: {result.get('toAmount', 'N/A')} {to_asset}")
-                return True
+                return self._convert_fill(result, amount)
             else:
                 print(f"❌ Помилка конвертації: невідома відповідь від API")
-                return False
+                return None
 
         except BinanceAPIException as e:
+            handle_api_error(self.client, e)
             error_logger.error(f"[ERROR] Binance API error converting {from_asset} -> {to_asset}: {e}")
             error_logger.error(f"  Error code: {e.code if hasattr(e, 'code') else 'N/A'}")
             error_logger.error(f"  Error message: {e.message if hasattr(e, 'message') else str(e)}")
@@ -595,21 +710,36 @@ class BTCETH_CMC20_Trader:
             print(f"❌ Помилка конвертації {from_asset} → {to_asset}: {e}")
             print(f"   Error code: {e.code if hasattr(e, 'code') else 'N/A'}")
             print(f"   Error message: {e.message if hasattr(e, 'message') else str(e)}")
-            return False
+            return None
         except Exception as e:
             error_logger.error(f"[ERROR] Unknown error converting {from_asset} -> {to_asset}: {e}")
             error_logger.error(traceback.format_exc())
             print(f"❌ Невідома помилка конвертації: {e}")
             traceback.print_exc()
-            return False
+            return None
         finally:
             trade_logger.info(f"{'='*60}")
 
+    @staticmethod
+    def _convert_fill(result: dict, amount: float) -> dict:
+        """Convert response -> {'fromAmount', 'toAmount'} (toAmount None if not reported)"""
+        to_amount = result.get('toAmount')
+        return {
+            'fromAmount': float(result.get('fromAmount', amount)),
+            'toAmount': float(to_amount) if to_amount is not None else None,
+        }
+
     def calculate_rebalancing_orders(self, current_balances: dict, target_allocation: dict,
-                                     total_portfolio_value: float) -> dict:
+                                     total_portfolio_value: float, snapshot: PriceSnapshot = None) -> dict:
         """
         ПОКРАЩЕНА логіка розрахунку з автоматичним вибором методу
+
+        Every price comes from one snapshot, so sells and buys are planned
+        against the same prices the portfolio was valued with.
         """
+        if snapshot is None:
+            snapshot = self.last_price_snapshot if self.last_price_snapshot is not None else self.get_price_snapshot()
+
         operations = {
             'sell_orders': {},
             'sell_convert': {},
@@ -625,21 +755,13 @@ class BTCETH_CMC20_Trader:
         print("-" * 80)
 
         # Determine quote currency
-        quote_currency = None
-        quote_balance = 0
-
-        for stable in ['USDC', 'USDT', 'BUSD', 'FDUSD']:
-            balance = current_balances.get(stable, {}).get('total', 0)
-            if balance > 0.1:
-                quote_currency = stable
-                quote_balance = balance
-                break
-
-        if not quote_currency:
-            quote_currency = 'USDC'
+        quote_currency, quote_balance = select_quote_currency(current_balances)
 
         print(f"💰 Quote currency: {quote_currency}, баланс: ${quote_balance:.2f}")
 
+        operations['quote_currency'] = quote_currency
+        operations['quote_balance'] = quote_balance
+
         total_sell_value = 0
         dust_balances = {}  # Collect dust
 
@@ -653,14 +775,15 @@ class BTCETH_CMC20_Trader:
             if abs(difference_value) < 0.5:  # Skip very small differences
                 continue
 
-            price = self.get_binance_price(symbol)
+            price = self.get_binance_price(symbol, snapshot)
             if price == 0:
                 continue
 
             # SELL operations
             if difference_value < 0:
                 sell_value = abs(difference_value)
-                quantity = sell_value / price
+                # Only the excess over target is sold or converted, never the whole holding
+                quantity = min(sell_value / price, current_quantity)
                 total_sell_value += sell_value
 
                 pair = f"{symbol}{quote_currency}"
@@ -668,6 +791,7 @@ class BTCETH_CMC20_Trader:
 
                 # Decision: market order or convert?
                 if sell_value >= self.min_trade_threshold and can_place:
+                    quantity = details['adjusted_quantity']
                     operations['sell_orders'][symbol] = {
                         'quantity': quantity,
                         'value_usdc': sell_value,
@@ -683,12 +807,12 @@ class BTCETH_CMC20_Trader:
                         print(f"🟠 CONVERT {symbol}→{quote_currency}: ${sell_value:,.2f} (причина: {reason})")
                     else:
                         print(f"🧹 DUST {symbol}: ${sell_value:,.2f} (буде конвертовано)")
-                        dust_balances[symbol] = current_quantity
+                        dust_balances[symbol] = quantity
 
                     operations['sell_convert'][symbol] = {
                         'from_asset': symbol,
                         'to_asset': quote_currency,
-                        'amount': current_quantity,
+                        'amount': quantity,
                         'value': sell_value,
                         'type': 'convert',
                         'reason': reason,
@@ -711,7 +835,7 @@ class BTCETH_CMC20_Trader:
             if difference_value <= 0.5:
                 continue
 
-            price = self.get_binance_price(symbol)
+            price = self.get_binance_price(symbol, snapshot)
             if price == 0:
                 continue
 
@@ -754,6 +878,7 @@ class BTCETH_CMC20_Trader:
 
             # Decision: market order or convert?
             if op['difference_value'] >= self.min_trade_threshold and can_place:
+                op['quantity'] = details['adjusted_quantity']
                 operations['buy_orders'][symbol] = {
                     'quantity': op['quantity'],
                     'value_usdc': op['difference_value'],
@@ -785,9 +910,49 @@ class BTCETH_CMC20_Trader:
         print("-" * 80)
         return operations
 
-    def execute_portfolio_rebalance(self, dry_run=False):
+    def probe_drift(self, bands: DriftBands) -> dict:
+        """
+        Дешева перевірка відхилення ваг від цільових (без CMC і без планування ордерів)
+
+        Values the account from memory when the user data stream and price
+        feed are live (one account + one ticker request otherwise) and
+        compares it with the last published target weights.
+
+        Returns:
+            measure_drift() report, or None when there are no fresh target
+            weights or no portfolio to compare - run the full rebalance then.
+            The valued balances are kept in last_drift_portfolio, priced
+            with last_price_snapshot.
+        """
+        index_size = 20 if self.index_type == 'CMC20' else 100
+        allocation = allocation_service.peek_btc_eth(index_size, self.stablecoins)
+        if allocation is None or time.time() - allocation.snapshot_at > DRIFT_TARGET_MAX_AGE:
+            return None
+
+        portfolio = self.get_cached_balances()
+        if portfolio is None:
+            portfolio = self.get_all_binance_balances(self.get_price_snapshot())
+        balances, total_portfolio_value = portfolio
+        if total_portfolio_value <= 0:
+            return None
+
+        # The full cycle reuses this valuation (with last_price_snapshot) when a band is breached
+        self.last_drift_portfolio = portfolio
+        report = measure_drift(balances, allocation.weights, bands, select_quote_currency(balances)[0])
+        report['allocation_version'] = allocation.tag
+        api_logger.info(
+            f"Drift probe: max deviation {report['max_deviation']:.2f}pp, "
+            f"out of band: {report['breached'] or 'none'}"
+        )
+        return report
+
+    def execute_portfolio_rebalance(self, dry_run=False, portfolio: tuple = None, snapshot: PriceSnapshot = None):
         """
         ПОКРАЩЕНЕ виконання ребалансування з конвертацією залишків
+
+        Args:
+            portfolio: (balances, total) already fetched by the caller with `snapshot`
+            snapshot: the cycle's prices; taken here when not given
         """
         trade_logger.info("=" * 80)
         trade_logger.info(f"[START] REBALANCE - Index: {self.index_type}, Dry run: {dry_run}")
@@ -797,8 +962,16 @@ class BTCETH_CMC20_Trader:
         print(f"⚠️ Режим: {'DRY RUN' if dry_run else '🔴 LIVE'}")
         print("=" * 80)
 
+        # One immutable set of prices for valuation, planning, dust and reporting
+        if snapshot is None:
+            snapshot = self.get_price_snapshot()
+        self.last_price_snapshot = snapshot
+
         # Get current state
-        current_balances, total_portfolio_value = self.get_all_binance_balances()
+        if portfolio is None:
+            portfolio = self.get_all_binance_balances(snapshot)
+            snapshot = self.last_price_snapshot  # completed from REST if the stream missed a held asset
+        current_balances, total_portfolio_value = portfolio
 
         if total_portfolio_value <= 0:
             return {"error": "Portfolio empty"}
@@ -809,24 +982,166 @@ class BTCETH_CMC20_Trader:
         if not target_allocation:
             return {"error": "Failed to fetch CMC data"}
 
-        # Calculate target values
+        try:
+            operations = self.plan_rebalance(current_balances, target_allocation, total_portfolio_value, snapshot)
+        except ExchangeInfoUnavailable as e:
+            error_logger.error(f"Rebalance aborted: {e}")
+            return {"error": "Failed to load exchange info"}
+
+        if dry_run:
+            return {
+                "status": "dry_run",
+                "operations": operations,
+                "index_type": self.index_type,
+                "allocation_version": self.last_target_allocation.tag if self.last_target_allocation else None,
+                "price_snapshot": snapshot.record(list(current_balances) + list(target_allocation), self.stablecoins)
+            }
+
+        return self.execute_rebalance_operations(operations, target_allocation, current_balances, snapshot)
+
+    def plan_rebalance(self, current_balances: dict, target_allocation: dict,
+                       total_portfolio_value: float, snapshot: PriceSnapshot = None) -> dict:
+        """Розраховує цільові суми та операції (без виконання)"""
+        # Calculate target values over what can be traded (index assets and the quote
+        # currency); other holdings are left alone, and counting them would set
+        # targets no rebalance can reach
+        quote_currency, _ = select_quote_currency(current_balances)
+        target_base = movable_value(current_balances, target_allocation, quote_currency)
         for symbol, data in target_allocation.items():
-            data['target_value'] = total_portfolio_value * (data['weight'] / 100)
+            data['target_value'] = target_base * (data['weight'] / 100)
+
+        # Load exchange filters once (no-op while the shared cache is fresh)
+        self._ensure_routing()
+        if not self.exchange_info.loaded:
+            # Without filters every leg would fail validation and fall through to a convert
+            raise ExchangeInfoUnavailable("Exchange filters unavailable, rebalance not planned")
 
         # Calculate operations
         operations = self.calculate_rebalancing_orders(
-            current_balances, target_allocation, total_portfolio_value
+            current_balances, target_allocation, total_portfolio_value, snapshot
         )
+        if CROSS_PAIR_ROUTING:
+            # Cross orders need no quote, so they are sized by the full shortfall,
+            # not by buy legs already scaled down to the quote budget
+            deficits = {}
+            for symbol, data in target_allocation.items():
+                shortfall = data['target_value'] - current_balances.get(symbol, {}).get('usdc_value', 0)
+                if shortfall > 0.5:
+                    deficits[symbol] = shortfall
+            operations = self.net_through_cross_pairs(operations, snapshot, deficits)
+        return operations
 
-        if dry_run:
-            return {
-                "status": "dry_run",
-                "operations": operations,
-                "index_type": self.index_type
+    def _cross_pair(self, from_asset: str, to_asset: str):
+        """(pair, base, quote) of a directly tradable pair between two assets, or None"""
+        if self.routing.has_pair(from_asset, to_asset):
+            return f"{from_asset}{to_asset}", from_asset, to_asset
+        if self.routing.has_pair(to_asset, from_asset):
+            return f"{to_asset}{from_asset}", to_asset, from_asset
+        return None
+
+    def _shrink_leg(self, orders: dict, symbol: str, value: float):
+        """Take `value` off a market order leg; drops it when the rest cannot be traded"""
+        data = orders.get(symbol)
+        if data is None:
+            return
+        remaining = data['value_usdc'] - value
+        if remaining < self.min_trade_threshold:
+            del orders[symbol]
+            return
+        pair = f"{symbol}{data['quote_currency']}"
+        can_place, reason, details = self.can_place_market_order(pair, remaining / data['price'], remaining)
+        if not can_place:
+            # What is left is within tolerance of the target
+            del orders[symbol]
+            return
+        data.update(quantity=details['adjusted_quantity'], value_usdc=remaining, reason=reason)
+
+    def net_through_cross_pairs(self, operations: dict, snapshot: PriceSnapshot = None,
+                                deficits: dict = None) -> dict:
+        """
+        Замінює пари продаж+купівля через стейблкоїн прямими ордерами (напр. ETHBTC)
+
+        Over-weight assets (market sells) and under-weight assets are matched
+        by max flow over directly tradable pairs; each matched amount becomes
+        one cross order instead of two quote legs.  `deficits` ({asset: USD
+        short of target}) bounds the buy side; without it the planned buy
+        legs are used.  Adds 'cross_orders' and a 'plan_savings' comparison
+        with the naive plan.
+        """
+        if snapshot is None:
+            snapshot = self.last_price_snapshot
+        operations.setdefault('cross_orders', {})
+        naive = plan_cost(operations)
+
+        sells, buys = operations['sell_orders'], operations['buy_orders']
+        if deficits is None:
+            deficits = {symbol: data['value_usdc'] for symbol, data in buys.items()}
+        flows = max_cross_flows(
+            {symbol: data['value_usdc'] for symbol, data in sells.items()},
+            deficits,
+            self._cross_pair
+        ) if sells and deficits and snapshot is not None else []
+
+        for flow in flows:
+            base_price = snapshot.usd_price(flow.base, self.stablecoins)
+            if flow.value < self.min_trade_threshold or not base_price:
+                continue
+            can_place, reason, details = self.can_place_market_order(flow.pair, flow.value / base_price, flow.value)
+            if not can_place:
+                continue
+
+            operations['cross_orders'][flow.pair] = {
+                'pair': flow.pair,
+                'base': flow.base,
+                'quote': flow.quote,
+                'side': flow.side,
+                'from_asset': flow.from_asset,
+                'to_asset': flow.to_asset,
+                'quantity': details['adjusted_quantity'],
+                'value_usdc': flow.value,
+                'price': snapshot.get(flow.pair),
+                'reason': reason
             }
+            self._shrink_leg(sells, flow.from_asset, flow.value)
+            self._shrink_leg(buys, flow.to_asset, flow.value)
+            convert = operations['buy_convert'].get(flow.to_asset)
+            if convert is not None:
+                # The quote leg was too small for a market order; the cross order covers it
+                convert['amount'] -= flow.value
+                if convert['amount'] <= 0.5:
+                    del operations['buy_convert'][flow.to_asset]
+            print(f"🔀 CROSS {flow.side} {flow.pair}: {flow.from_asset}→{flow.to_asset} "
+                  f"{details['adjusted_quantity']:,.8f} {flow.base} (${flow.value:,.2f})")
+
+        planned = plan_cost(operations)
+        operations['plan_savings'] = {
+            'naive_orders': naive['orders'],
+            'orders': planned['orders'],
+            'naive_fees': naive['fees'],
+            'fees': planned['fees'],
+            'saved_fees': naive['fees'] - planned['fees'],
+            'fee_rate': TRADING_FEE_RATE,
+        }
+        if operations['cross_orders']:
+            print(f"💸 Економія: {naive['orders'] - planned['orders']} ордерів, "
+                  f"${naive['fees'] - planned['fees']:.2f} комісій")
+        return operations
+
+    def execute_rebalance_operations(self, operations: dict, target_allocation: dict,
+                                     current_balances: dict = None, snapshot: PriceSnapshot = None) -> dict:
+        """
+        Виконує розраховані операції: продаж, купівля, конвертація залишків
+
+        Balances are tracked in a BalanceLedger seeded from `current_balances`
+        and updated from every fill, so no balance refetch is needed between
+        phases.  Prices come from the cycle's `snapshot`.
+        """
+        if snapshot is None:
+            snapshot = self.last_price_snapshot
 
         # Execute operations
         results = {
+            "cross_orders": [],
             "sell_orders": [],
             "sell_convert": [],
             "buy_orders": [],
@@ -834,115 +1149,152 @@ class BTCETH_CMC20_Trader:
             "dust_conversion": {}
         }
 
-        # PHASE 1: SELLS
-        if operations['sell_orders'] or operations['sell_convert']:
-            print("\n📤 ФАЗА 1: ПРОДАЖ")
-            print("=" * 80)
-
-            for symbol, data in operations['sell_orders'].items():
-                success = self.execute_market_order(
-                    symbol=symbol,
-                    side='SELL',
-                    quantity=data['quantity'],
-                    quote_currency=data['quote_currency'],
-                    dry_run=False
-                )
-                results['sell_orders'].append({
-                    "symbol": symbol,
-                    "success": success,
-                    "quantity": data['quantity']
-                })
-                if success:
-                    time.sleep(1)
-
-            for symbol, data in operations['sell_convert'].items():
-                if not data.get('is_dust'):  # Process non-dust converts now
-                    success = self.execute_convert(
-                        from_asset=data['from_asset'],
-                        to_asset=data['to_asset'],
-                        amount=data['amount'],
-                        dry_run=False
-                    )
-                    results['sell_convert'].append({
-                        "symbol": symbol,
-                        "success": success
-                    })
-                    if success:
-                        time.sleep(2)
-
-        # PHASE 1.5: Update balance
-        time.sleep(2)
-        current_balances, _ = self.get_all_binance_balances()
-
-        quote_currency = 'USDC'
-        for stable in ['USDC', 'USDT', 'BUSD', 'FDUSD']:
-            if current_balances.get(stable, {}).get('total', 0) > 0.1:
-                quote_currency = stable
-                break
+        FEE_RESERVE = 0.01
+        quote_currency = operations.get('quote_currency', 'USDC')
 
-        available_balance = current_balances.get(quote_currency, {}).get('total', 0)
-        print(f"\n💰 Доступно після продажу: ${available_balance:.2f} {quote_currency}")
+        ledger = BalanceLedger(
+            current_balances if current_balances is not None
+            else {quote_currency: {'total': operations.get('quote_balance', 0.0)}}
+        )
 
-        # PHASE 2: BUYS
-        if operations['buy_orders'] or operations['buy_convert']:
-            print("\n📥 ФАЗА 2: КУПІВЛЯ")
-            print("=" * 80)
+        limiter = order_limiter_for(
+            self.client, order_limits_from_exchange_info(self.exchange_info.rate_limits)
+        )
 
-            for symbol, data in operations['buy_orders'].items():
-                needed = data['value_usdc'] * 1.01
+        # Sells are queued before buys: the executor is FIFO, so every sell
+        # has a worker before any buy can block waiting for quote
+        sell_jobs = [('sell_orders', symbol, data) for symbol, data in operations['sell_orders'].items()]
+        sell_jobs += [('sell_convert', symbol, data) for symbol, data in operations['sell_convert'].items()
+                      if not data.get('is_dust')]  # Dust is converted in phase 3
+        buy_jobs = [('buy_orders', symbol, data) for symbol, data in operations['buy_orders'].items()]
+        buy_jobs += [('buy_convert', symbol, data) for symbol, data in operations['buy_convert'].items()]
+
+        budget = QuoteBudget(operations.get('quote_balance', 0.0), pending_sells=len(sell_jobs))
+
+        def run_cross(pair, data):
+            # Moves value straight between two assets; the quote budget is untouched
+            limiter.acquire()
+            order = self.place_market_order(
+                symbol=data['base'],
+                side=data['side'],
+                quantity=data['quantity'],
+                quote_currency=data['quote'],
+                dry_run=False
+            )
+            if order is not None:
+                ledger.apply_order(order, data['base'], data['quote'])
+            return {"symbol": pair, "success": order is not None, "side": data['side'],
+                    "quantity": data['quantity']}
 
-                if needed > available_balance:
-                    print(f"⚠️ Пропуск {symbol}: недостатньо коштів")
-                    continue
+        def run_sell(kind, symbol, data):
+            proceeds = 0.0
+            try:
+                limiter.acquire()
+                if kind == 'sell_orders':
+                    order = self.place_market_order(
+                        symbol=symbol,
+                        side='SELL',
+                        quantity=data['quantity'],
+                        quote_currency=data['quote_currency'],
+                        dry_run=False
+                    )
+                    if order is not None:
+                        delta = ledger.apply_order(order, symbol, data['quote_currency'])
+                        proceeds = delta if data['quote_currency'] == quote_currency else 0.0
+                    return {"symbol": symbol, "success": order is not None, "quantity": data['quantity']}
 
-                success = self.execute_market_order(
-                    symbol=symbol,
-                    side='BUY',
-                    quantity=data['quantity'],
-                    quote_currency=data['quote_currency'],
+                fill = self.place_convert(
+                    from_asset=data['from_asset'],
+                    to_asset=data['to_asset'],
+                    amount=data['amount'],
                     dry_run=False
                 )
+                if fill is not None:
+                    received = fill['toAmount']
+                    if received is None:
+                        # Convert did not report the amount: fall back to the estimate
+                        received = data['value'] * (1 - FEE_RESERVE)
+                    ledger.apply_convert(data['from_asset'], data['to_asset'], fill['fromAmount'], received)
+                    proceeds = received if data['to_asset'] == quote_currency else 0.0
+                return {"symbol": symbol, "success": fill is not None}
+            finally:
+                budget.credit(proceeds)
+
+        def run_buy(kind, symbol, data):
+            needed = (data['value_usdc'] if kind == 'buy_orders' else data['amount']) * 1.01
+
+            if not budget.reserve(needed):
+                print(f"⚠️ Пропуск {symbol}: недостатньо коштів")
+                return None
 
-                if success:
-                    available_balance -= needed
-                    time.sleep(1)
-
-                results['buy_orders'].append({
-                    "symbol": symbol,
-                    "success": success
-                })
-
-            for symbol, data in operations['buy_convert'].items():
-                needed = data['amount'] * 1.01
-
-                if needed > available_balance:
-                    print(f"⚠️ Пропуск {symbol}: недостатньо коштів")
-                    continue
+            spent = 0.0
+            try:
+                limiter.acquire()
+                if kind == 'buy_orders':
+                    order = self.place_market_order(
+                        symbol=symbol,
+                        side='BUY',
+                        quantity=data['quantity'],
+                        quote_currency=data['quote_currency'],
+                        dry_run=False
+                    )
+                    if order is not None:
+                        spent = -ledger.apply_order(order, symbol, data['quote_currency'])
+                    return {"symbol": symbol, "success": order is not None}
 
-                success = self.execute_convert(
+                fill = self.place_convert(
                     from_asset=data['from_asset'],
                     to_asset=data['to_asset'],
                     amount=data['amount'],
                     dry_run=False
                 )
+                if fill is not None:
+                    spent = fill['fromAmount']
+                    to_amount = fill['toAmount']
+                    if to_amount is None:
+                        price = self.get_binance_price(data['to_asset'], snapshot)
+                        to_amount = spent / price if price else 0.0
+                    ledger.apply_convert(data['from_asset'], data['to_asset'], spent, to_amount)
+                return {"symbol": symbol, "success": fill is not None}
+            finally:
+                # Return whatever the fill did not actually use
+                budget.release(max(0.0, needed - spent))
+
+        cross_jobs = list(operations.get('cross_orders', {}).items())
+
+        # PHASE 1 + 2: CROSS, SELLS and BUYS, fanned out within the order rate limits
+        if cross_jobs or sell_jobs or buy_jobs:
+            print(f"\n📤📥 ФАЗА 1-2: ПРОДАЖ ТА КУПІВЛЯ (паралельно: {ORDER_PARALLELISM})")
+            print("=" * 80)
 
-                if success:
-                    available_balance -= needed
-                    time.sleep(2)
+            with ThreadPoolExecutor(max_workers=ORDER_PARALLELISM, thread_name_prefix='orders') as executor:
+                futures = [('cross_orders', executor.submit(run_cross, pair, data)) for pair, data in cross_jobs]
+                futures += [(kind, executor.submit(run_sell, kind, symbol, data)) for kind, symbol, data in sell_jobs]
+                futures += [(kind, executor.submit(run_buy, kind, symbol, data)) for kind, symbol, data in buy_jobs]
 
-                results['buy_convert'].append({
-                    "symbol": symbol,
-                    "success": success
-                })
+                for kind, future in futures:
+                    try:
+                        entry = future.result()
+                    except Exception as e:
+                        error_logger.error(f"Order job failed: {e}")
+                        error_logger.error(traceback.format_exc())
+                        continue
+                    if entry is not None:
+                        results[kind].append(entry)
+
+        available_balance = ledger.get(quote_currency)
 
         # PHASE 3: Convert dust to larger positions
         if operations.get('dust_to_convert') and self.auto_convert_dust:
             print("\n🧹 ФАЗА 3: КОНВЕРТАЦІЯ ЗАЛИШКІВ")
             print("=" * 80)
 
+            # Post-trade holdings come from the fills, priced with the cycle's snapshot
+            post_trade = ledger.as_balances(snapshot, self.stablecoins)
+
             # Determine which asset has lower allocation (needs more)
-            current_btc = current_balances.get('BTC', {}).get('usdc_value', 0)
-            current_eth = current_balances.get('ETH', {}).get('usdc_value', 0)
+            current_btc = post_trade.get('BTC', {}).get('usdc_value', 0)
+            current_eth = post_trade.get('ETH', {}).get('usdc_value', 0)
             target_btc = target_allocation['BTC']['target_value']
             target_eth = target_allocation['ETH']['target_value']
 
@@ -959,24 +1311,92 @@ class BTCETH_CMC20_Trader:
             dust_results = self.convert_dust_to_target(
                 operations['dust_to_convert'],
                 target_for_dust,
-                quote_currency
+                quote_currency,
+                ledger=ledger,
+                snapshot=snapshot
             )
 
             results['dust_conversion'] = dust_results
+            available_balance = ledger.get(quote_currency)
 
         # Final summary
         print("\n✅ РЕБАЛАНСУВАННЯ ЗАВЕРШЕНО")
         print(f"💰 Кінцевий баланс {quote_currency}: ${available_balance:.2f}")
         print("=" * 80)
 
-        return {
+        result = {
             "status": "completed",
             "results": results,
             "index_type": self.index_type,
+            "allocation_version": self.last_target_allocation.tag if self.last_target_allocation else None,
+            "plan_savings": operations.get('plan_savings'),
+            "price_snapshot": snapshot.record(
+                list(current_balances or {}) + list(target_allocation), self.stablecoins
+            ) if snapshot is not None else None,
             "timestamp": datetime.now().isoformat()
         }
 
+        if RECONCILE_AFTER_REBALANCE:
+            result["reconciliation"] = self.reconcile_ledger(ledger)
+
+        return result
+
+    def reconcile_ledger(self, ledger: BalanceLedger) -> dict:
+        """
+        Порівнює баланси з ордерів із фактичним акаунтом (один запит, без оцінки цін)
+
+        Returns:
+            {'checked': bool, 'mismatches': {asset: {'ledger', 'exchange'}}}
+        """
+        try:
+            account = self.client.get_account()
+        except Exception as e:
+            error_logger.error(f"Ledger reconciliation failed: {e}")
+            return {'checked': False, 'error': str(e)}
+
+        mismatches = {
+            asset: {'ledger': expected, 'exchange': actual}
+            for asset, (expected, actual) in ledger.diff(account.get('balances', [])).items()
+            # Tiny differences come from rounding of reported commissions
+            if abs(expected - actual) > max(abs(actual), abs(expected)) * 1e-6
+        }
+        if mismatches:
+            trade_logger.warning(f"Ledger differs from account balances: {mismatches}")
+        return {'checked': True, 'mismatches': mismatches}
+
+
 
+    def request_stop(self):
+        """Зупиняє run_continuous_rebalance одразу, навіть під час очікування"""
+        self._stop_requested.set()
+        self._wakeup.set()
+
+    def schedule_next_run(self, when: datetime):
+        """Переносить наступний цикл run_continuous_rebalance"""
+        self._next_run_override = when
+        self._wakeup.set()
+
+    def set_update_interval(self, seconds: int):
+        """Змінює інтервал; поточне очікування перераховується одразу"""
+        self.update_interval = seconds
+        self._wakeup.set()
+
+    def _wait_for_next_run(self, last_run: datetime) -> bool:
+        """
+        Чекає до наступного циклу з дедлайном від останнього запуску
+
+        Returns:
+            False if a stop was requested while waiting
+        """
+        while not self._stop_requested.is_set():
+            deadline = self._next_run_override or last_run + timedelta(seconds=self.update_interval)
+            remaining = (deadline - datetime.now()).total_seconds()
+            if remaining <= 0:
+                self._next_run_override = None
+                return True
+            self._wakeup.wait(remaining)
+            self._wakeup.clear()
+        return False
 
     def run_continuous_rebalance(self, dry_run=False):
         """Постійне ребалансування кожні N секунд згідно з .env"""
@@ -991,9 +1411,11 @@ class BTCETH_CMC20_Trader:
         print("=" * 80)
 
         cycle_count = 0
+        self._stop_requested.clear()
 
-        while True:
+        while not self._stop_requested.is_set():
             cycle_count += 1
+            last_run = datetime.now()
             print(f"\n\n{'=' * 80}")
             print(f"🔄 ЦИКЛ РЕБАЛАНСУВАННЯ #{cycle_count}")
             print(f"{'=' * 80}")
@@ -1009,7 +1431,7 @@ class BTCETH_CMC20_Trader:
                 print("😴 Очікування...")
                 print(f"{'=' * 80}\n")
 
-                time.sleep(interval_seconds)
+                self._wait_for_next_run(last_run)
 
             except KeyboardInterrupt:
                 print("\n\n" + "=" * 80)
@@ -1022,7 +1444,7 @@ class BTCETH_CMC20_Trader:
             except Exception as e:
                 print(f"\n❌ Помилка в циклі ребалансування: {e}")
                 print(f"⏰ Спроба повторного запуску через {interval_seconds} секунд...")
-                time.sleep(interval_seconds)
+                self._wait_for_next_run(last_run)
 
     def get_btc_eth_allocation_from_cmc(self) -> dict:
         """
@@ -1032,91 +1454,21 @@ class BTCETH_CMC20_Trader:
         api_logger.info(f"Fetching CMC Top {index_size} allocation data...")
 
         try:
-            headers = {
-                'X-CMC_PRO_API_KEY': self.cmc_api_key,
-                'Accept': 'application/json'
-            }
-
-            # Fetch more to account for stablecoins
-            fetch_limit = index_size + 30
-
-            params = {
-                'start': '1',
-                'limit': str(fetch_limit),
-                'convert': 'USD'
-            }
-
-            response = requests.get(self.cmc_api_url, headers=headers, params=params)
-            data = response.json()
-
-            if response.status_code != 200:
-                error_msg = data.get('status', {}).get('error_message', 'Unknown error')
-                error_logger.error(f"CoinMarketCap API error: {error_msg}")
-                return {}
-
-            coins = data['data']
-
-            # Remove stablecoins
-            coins = [coin for coin in coins if coin['symbol'] not in self.stablecoins]
-
-            # Take top N (without stablecoins)
-            top_coins = coins[:index_size]
-
-            # Calculate total market cap
-            total_market_cap = sum(coin['quote']['USD']['market_cap'] for coin in top_coins)
-
-            # Find BTC and ETH
-            btc_data = None
-            eth_data = None
-            other_total_market_cap = 0.0
-
-            for coin in top_coins:
-                market_cap = coin['quote']['USD']['market_cap']
+            # Computed once per CMC snapshot and shared by every trader on this index
+            allocation = allocation_service.btc_eth(self.cmc_api_key, index_size, self.stablecoins)
 
-                if coin['symbol'] == 'BTC':
-                    btc_data = coin
-                elif coin['symbol'] == 'ETH':
-                    eth_data = coin
-                else:
-                    other_total_market_cap += market_cap
-
-            if not btc_data or not eth_data:
+            if allocation is None:
                 error_logger.error(f"BTC or ETH not found in CMC Top {index_size}")
                 return {}
+            self.last_target_allocation = allocation
 
-            # Calculate weights
-            btc_original_weight = (btc_data['quote']['USD']['market_cap'] / total_market_cap) * 100
-            eth_original_weight = (eth_data['quote']['USD']['market_cap'] / total_market_cap) * 100
-            other_weight = (other_total_market_cap / total_market_cap) * 100
-
-            # Split remaining tokens 50/50
-            redistribution_per_token = other_weight / 2
-
-            btc_final_weight = btc_original_weight + redistribution_per_token
-            eth_final_weight = eth_original_weight + redistribution_per_token
-
-            allocation_data = {
-                'BTC': {
-                    'rank': btc_data['cmc_rank'],
-                    'name': btc_data['name'],
-                    'original_weight': btc_original_weight,
-                    'redistribution_bonus': redistribution_per_token,
-                    'weight': btc_final_weight,
-                    'market_cap': btc_data['quote']['USD']['market_cap'],
-                    'price': btc_data['quote']['USD']['price'],
-                    'change_24h': btc_data['quote']['USD']['percent_change_24h']
-                },
-                'ETH': {
-                    'rank': eth_data['cmc_rank'],
-                    'name': eth_data['name'],
-                    'original_weight': eth_original_weight,
-                    'redistribution_bonus': redistribution_per_token,
-                    'weight': eth_final_weight,
-                    'market_cap': eth_data['quote']['USD']['market_cap'],
-                    'price': eth_data['quote']['USD']['price'],
-                    'change_24h': eth_data['quote']['USD']['percent_change_24h']
-                }
-            }
+            allocation_data = allocation.as_dict()
+            total_market_cap = allocation.total_market_cap
+            btc_original_weight = allocation_data['BTC']['original_weight']
+            eth_original_weight = allocation_data['ETH']['original_weight']
+            btc_final_weight = allocation_data['BTC']['weight']
+            eth_final_weight = allocation_data['ETH']['weight']
+            other_weight = allocation_data['BTC']['redistribution_bonus'] * 2
 
             print(f"\n🔍 РОЗПОДІЛ {self.index_type} (50/50):")
             print(f"   📊 Топ-{index_size} капіталізація: ${total_market_cap:,.0f}")
@@ -1128,13 +1480,17 @@ class BTCETH_CMC20_Trader:
             api_logger.info(f"{self.index_type} allocation: BTC={btc_final_weight:.2f}%, ETH={eth_final_weight:.2f}%")
             return allocation_data
 
+        except CoinMarketCapError as e:
+            error_logger.error(f"CoinMarketCap API error: {e}")
+            return {}
         except Exception as e:
             error_logger.error(f"Error fetching {self.index_type}: {e}")
             error_logger.error(traceback.format_exc())
             return {}
 
     def convert_dust_to_target(self, dust_balances: dict, target_asset: str,
-                               quote_currency: str = 'USDC') -> dict:
+                               quote_currency: str = 'USDC', ledger: BalanceLedger = None,
+                               snapshot: PriceSnapshot = None) -> dict:
         """
         Конвертує малі залишки (пил) в цільовий актив
 
@@ -1142,6 +1498,8 @@ class BTCETH_CMC20_Trader:
             dust_balances: {'BTC': 0.00001, 'ETH': 0.0001, ...}
             target_asset: 'BTC' or 'ETH'
             quote_currency: проміжна валюта для конвертації
+            ledger: BalanceLedger to update from the converts (optional)
+            snapshot: the cycle's prices (optional; live prices otherwise)
 
         Returns:
             {'converted': [...], 'failed': [...], 'total_value': 0.0}
@@ -1161,9 +1519,12 @@ class BTCETH_CMC20_Trader:
         for symbol, quantity in dust_balances.items():
             if symbol == target_asset:
                 continue
+            if ledger is not None:
+                # Never convert more than the fills left of the asset
+                quantity = min(quantity, ledger.get(symbol))
 
             # Calculate value
-            price = self.get_binance_price(symbol)
+            price = self.get_binance_price(symbol, snapshot)
             if price == 0:
                 results['failed'].append({
                     'symbol': symbol,
@@ -1181,14 +1542,20 @@ class BTCETH_CMC20_Trader:
 
             # Try direct conversion first
             try:
-                success = self.execute_convert(
+                fill = self.place_convert(
                     from_asset=symbol,
                     to_asset=target_asset,
                     amount=quantity,
                     dry_run=False
                 )
 
-                if success:
+                if fill is not None:
+                    if ledger is not None:
+                        target_price = self.get_binance_price(target_asset, snapshot)
+                        received = fill['toAmount']
+                        if received is None:
+                            received = value_usdc / target_price if target_price else 0.0
+                        ledger.apply_convert(symbol, target_asset, fill['fromAmount'], received)
                     results['converted'].append({
                         'symbol': symbol,
                         'quantity': quantity,
@@ -1196,7 +1563,6 @@ class BTCETH_CMC20_Trader:
                         'method': 'direct'
                     })
                     results['total_value'] += value_usdc
-                    time.sleep(1)
                     continue
             except Exception as e:
                 debug_logger.debug(f"Direct convert failed for {symbol}: {e}")
@@ -1204,34 +1570,43 @@ class BTCETH_CMC20_Trader:
             # Try two-step conversion: symbol → quote → target
             try:
                 # Step 1: symbol → quote_currency
-                success1 = self.execute_convert(
+                fill1 = self.place_convert(
                     from_asset=symbol,
                     to_asset=quote_currency,
                     amount=quantity,
                     dry_run=False
                 )
 
-                if not success1:
+                if fill1 is None:
                     raise Exception("Step 1 failed")
 
-                time.sleep(1)
-
                 # Step 2: quote_currency → target_asset
-                # Get new balance of quote_currency
-                balance = self.client.get_asset_balance(asset=quote_currency)
-                quote_amount = float(balance['free'])
+                if fill1['toAmount'] is not None:
+                    # Only what step 1 produced, known from the fill
+                    quote_amount = fill1['toAmount']
+                else:
+                    balance = self.client.get_asset_balance(asset=quote_currency)
+                    quote_amount = float(balance['free'])
+                if ledger is not None:
+                    ledger.apply_convert(symbol, quote_currency, fill1['fromAmount'], quote_amount)
 
                 if quote_amount < 0.10:
                     raise Exception("Insufficient quote currency after step 1")
 
-                success2 = self.execute_convert(
+                fill2 = self.place_convert(
                     from_asset=quote_currency,
                     to_asset=target_asset,
                     amount=quote_amount,
                     dry_run=False
                 )
 
-                if success2:
+                if fill2 is not None:
+                    if ledger is not None:
+                        target_price = self.get_binance_price(target_asset, snapshot)
+                        received = fill2['toAmount']
+                        if received is None:
+                            received = quote_amount / target_price if target_price else 0.0
+                        ledger.apply_convert(quote_currency, target_asset, fill2['fromAmount'], received)
                     results['converted'].append({
                         'symbol': symbol,
                         'quantity': quantity,
@@ -1239,7 +1614,6 @@ class BTCETH_CMC20_Trader:
                         'method': 'two_step'
                     })
                     results['total_value'] += value_usdc
-                    time.sleep(1)
                 else:
                     raise Exception("Step 2 failed")
 
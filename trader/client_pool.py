@@ -0,0 +1,133 @@
+"""
+Pool of live python-binance clients.
+
+Creating a `Client` pings the exchange, so dashboard requests and trader
+loops reuse warm clients keyed by (credentials hash, tld, testnet, proxy).
+Clients that have not been used for `idle_timeout` seconds are dropped
+from the pool, but a dropped client that is still referenced (e.g. by a
+live trader and its user data stream) is handed out again instead of
+being rebuilt.
+"""
+import os
+import time
+import weakref
+import hashlib
+import logging
+import threading
+
+from binance.client import Client
+
+from trader.http_sessions import binance_requests_params, mount_shared_pool
+
+debug_logger = logging.getLogger('debug')
+
+
+class _PooledClient:
+    __slots__ = ('client', 'last_used')
+
+    def __init__(self, client):
+        self.client = client
+        self.last_used = time.time()
+
+
+class BinanceClientPool:
+    """Thread-safe keyed pool of Binance clients with idle eviction"""
+
+    # Twice the default rebalance interval, so scheduled traders keep their client between cycles
+    DEFAULT_IDLE_TIMEOUT = int(os.getenv('BINANCE_CLIENT_IDLE_TIMEOUT', 7200))
+
+    def __init__(self, idle_timeout: int = None):
+        self.idle_timeout = idle_timeout if idle_timeout is not None else self.DEFAULT_IDLE_TIMEOUT
+        self._clients = {}
+        # Evicted clients, for as long as something else still holds them
+        self._evicted = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    @staticmethod
+    def make_key(api_key: str, api_secret: str, tld: str, testnet: bool, proxy_url: str = None) -> tuple:
+        # Never keep raw credentials in the key
+        credentials = hashlib.sha256(f"{api_key}:{api_secret}".encode()).hexdigest()
+        proxy = hashlib.sha256(proxy_url.encode()).hexdigest() if proxy_url else None
+        return credentials, tld, bool(testnet), proxy
+
+    def acquire(self, api_key: str, api_secret: str, tld: str = 'com',
+                testnet: bool = False, proxy_url: str = None) -> tuple:
+        """
+        Get a warm client, creating one if needed.
+
+        Returns:
+            (client, created) - created is True for a brand new client
+        """
+        tld = tld if not testnet else 'com'  # Testnet only works with .com
+        key = self.make_key(api_key, api_secret, tld, testnet, proxy_url)
+
+        self.evict_idle()
+
+        with self._lock:
+            pooled = self._clients.get(key)
+            if pooled is None:
+                client = self._evicted.pop(key, None)
+                if client is not None:
+                    # Still in use elsewhere: back into the pool, no new client or stream
+                    pooled = self._clients[key] = _PooledClient(client)
+            if pooled is not None:
+                pooled.last_used = time.time()
+                self.reused += 1
+                return pooled.client, False
+
+        # Construct outside the lock: Client() pings the exchange
+        client = Client(
+            api_key,
+            api_secret,
+            testnet=testnet,
+            tld=tld,
+            requests_params=binance_requests_params(proxy_url)
+        )
+        # Reuse pooled keep-alive connections shared with other clients
+        mount_shared_pool(client.session)
+
+        with self._lock:
+            pooled = self._clients.get(key)
+            if pooled is not None:
+                # Another thread won the race; keep its client
+                pooled.last_used = time.time()
+                self.reused += 1
+                return pooled.client, False
+            self._clients[key] = _PooledClient(client)
+            self.created += 1
+
+        debug_logger.info(f"Binance client created (pool size: {len(self._clients)})")
+        return client, True
+
+    def evict_idle(self):
+        """Drop clients unused for longer than idle_timeout"""
+        cutoff = time.time() - self.idle_timeout
+        with self._lock:
+            expired = [key for key, pooled in self._clients.items() if pooled.last_used < cutoff]
+            evicted = [self._clients.pop(key) for key in expired]
+            for key, pooled in zip(expired, evicted):
+                self._evicted[key] = pooled.client
+
+        # Sessions are not closed: that would also close the shared
+        # connection adapter used by every other client
+        if evicted:
+            debug_logger.info(f"Evicted {len(evicted)} idle Binance clients")
+
+    def clients(self) -> list:
+        """Live clients currently in the pool"""
+        with self._lock:
+            return [pooled.client for pooled in self._clients.values()]
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._clients),
+            'created': self.created,
+            'reused': self.reused,
+            'idle_timeout': self.idle_timeout,
+        }
+
+
+# Shared by all traders in this process
+client_pool = BinanceClientPool()
@@ -0,0 +1,136 @@
+"""
+Background clock-offset synchronizer.
+
+One synchronizer per Binance endpoint measures the server/local clock
+offset on a schedule (with round-trip compensation), smooths it, and
+pushes it to every registered client as `client.timestamp_offset`.
+Constructing a trader therefore costs no server-time round-trips, except
+for the very first one on an endpoint, which waits (once per process) for
+the initial measurement so its first signed calls carry an offset.
+"""
+import os
+import time
+import weakref
+import logging
+import threading
+
+from trader.market_data import endpoint_key
+
+debug_logger = logging.getLogger('debug')
+error_logger = logging.getLogger('errors')
+
+# Binance error code for "Timestamp for this request is outside of the recvWindow"
+TIMESTAMP_ERROR_CODE = -1021
+
+
+class ClockSynchronizer:
+    """Keeps `timestamp_offset` fresh on all clients of one endpoint"""
+
+    DEFAULT_INTERVAL = int(os.getenv('BINANCE_CLOCK_SYNC_INTERVAL', 300))
+    SAMPLES = 3          # server-time calls per measurement; lowest RTT wins
+    SMOOTHING = 0.3      # EWMA weight of a new measurement
+    INITIAL_SYNC_TIMEOUT = float(os.getenv('BINANCE_CLOCK_SYNC_TIMEOUT', 10))
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, interval: int = None):
+        self.interval = interval if interval is not None else self.DEFAULT_INTERVAL
+        self.offset = None       # smoothed offset in ms (server - local)
+        self.last_rtt = None     # ms
+        self.synced_at = 0.0
+        self._clients = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._initial = threading.Event()   # set once the first measurement has been attempted
+        self._thread = None
+
+    @classmethod
+    def shared(cls, client) -> 'ClockSynchronizer':
+        """Synchronizer for the client's endpoint"""
+        key = endpoint_key(client)
+        with cls._instances_lock:
+            sync = cls._instances.get(key)
+            if sync is None:
+                sync = cls._instances[key] = cls()
+            return sync
+
+    def register(self, client):
+        """
+        Apply the current offset to a client and keep it updated.
+
+        Until the first measurement of the endpoint has been attempted the
+        caller blocks (up to INITIAL_SYNC_TIMEOUT), so a trader built at
+        start-up does not sign requests with an unsynchronized clock.
+        """
+        with self._lock:
+            self._clients.add(client)
+            if self.offset is not None:
+                client.timestamp_offset = int(self.offset)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='clock-sync', daemon=True)
+                self._thread.start()
+
+        if not self._initial.is_set():
+            if not self._initial.wait(self.INITIAL_SYNC_TIMEOUT):
+                error_logger.warning("Initial clock sync timed out, signing without an offset")
+            with self._lock:
+                if self.offset is not None:
+                    client.timestamp_offset = int(self.offset)
+
+    def resync(self):
+        """Request an immediate measurement (e.g. after a -1021 error)"""
+        self._wakeup.set()
+
+    def measure(self, client) -> tuple:
+        """(offset_ms, rtt_ms) of the lowest-RTT sample"""
+        best = None
+        for _ in range(self.SAMPLES):
+            sent = time.time() * 1000
+            server_time = client.get_server_time()['serverTime']
+            received = time.time() * 1000
+            rtt = received - sent
+            # Server stamped the response roughly half-way through the round trip
+            offset = server_time - (sent + rtt / 2)
+            if best is None or rtt < best[1]:
+                best = (offset, rtt)
+        return best
+
+    def sync(self):
+        """Measure once and push the smoothed offset to all registered clients"""
+        clients = list(self._clients)
+        if not clients:
+            return
+
+        offset, rtt = self.measure(clients[0])
+        with self._lock:
+            if self.offset is None or abs(offset - self.offset) > 1000:
+                # First measurement or a clock jump: take it as is
+                self.offset = offset
+            else:
+                self.offset = (1 - self.SMOOTHING) * self.offset + self.SMOOTHING * offset
+            self.last_rtt = rtt
+            self.synced_at = time.time()
+            smoothed = int(self.offset)
+
+        for client in clients:
+            client.timestamp_offset = smoothed
+        debug_logger.info(f"Clock offset synchronized: {smoothed}ms (rtt {rtt:.0f}ms, {len(clients)} clients)")
+
+    def _run(self):
+        while True:
+            try:
+                self.sync()
+            except Exception as e:
+                error_logger.warning(f"Clock sync failed: {e}")
+            # Release registrations waiting on the first measurement, even a failed one
+            self._initial.set()
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+
+def handle_api_error(client, error):
+    """Trigger an immediate resync when Binance rejects a request timestamp"""
+    if getattr(error, 'code', None) == TIMESTAMP_ERROR_CODE:
+        debug_logger.warning("Timestamp rejected by Binance, resynchronizing clock offset")
+        ClockSynchronizer.shared(client).resync()
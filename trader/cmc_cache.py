@@ -0,0 +1,179 @@
+"""
+Process-wide CoinMarketCap listings cache.
+
+Every trader in the process shares one cache, so users on the same index
+configuration reuse a single /listings/latest response instead of each
+spending CMC credits on identical data.
+"""
+import os
+import time
+import logging
+import threading
+
+from trader import http_sessions
+from trader.cmc_snapshots import SnapshotStore
+
+api_logger = logging.getLogger('api')
+debug_logger = logging.getLogger('debug')
+
+CMC_LISTINGS_URL = "https://pro-api.coinmarketcap.com/v1/cryptocurrency/listings/latest"
+
+
+class CoinMarketCapError(Exception):
+    """CoinMarketCap returned an error or an unusable response"""
+
+
+def fetch_listings(api_key: str, limit: int, convert: str = 'USD') -> list:
+    """Single /listings/latest request; returns the 'data' list"""
+    headers = {
+        'X-CMC_PRO_API_KEY': api_key,
+        'Accept': 'application/json'
+    }
+    params = {
+        'start': '1',
+        'limit': str(limit),
+        'convert': convert
+    }
+
+    api_logger.debug(f"Calling CoinMarketCap API with limit={limit}, convert={convert}")
+    response = http_sessions.request('GET', CMC_LISTINGS_URL, headers=headers, params=params)
+    data = response.json()
+
+    if response.status_code != 200:
+        error_msg = data.get('status', {}).get('error_message', 'Unknown error')
+        raise CoinMarketCapError(error_msg)
+
+    return data['data']
+
+
+class _Entry:
+    __slots__ = ('coins', 'fetched_at', 'lock', 'refreshing')
+
+    def __init__(self):
+        self.coins = None
+        self.fetched_at = 0.0
+        self.lock = threading.Lock()
+        self.refreshing = False
+
+
+class ListingsCache:
+    """
+    TTL-bounded listings cache keyed by (limit, convert).
+
+    - fresh entry (age < ttl): served from memory
+    - stale entry (ttl <= age < ttl + max_stale): served from memory while a
+      single background thread refreshes it
+    - missing/expired entry: fetched synchronously; concurrent callers for
+      the same key wait for that one request instead of issuing their own
+    """
+
+    DEFAULT_TTL = int(os.getenv('CMC_CACHE_TTL', 300))
+    DEFAULT_MAX_STALE = int(os.getenv('CMC_CACHE_MAX_STALE', 3600))
+
+    def __init__(self, ttl: int = None, max_stale: int = None, fetcher=fetch_listings, store=None):
+        self.ttl = ttl if ttl is not None else self.DEFAULT_TTL
+        self.max_stale = max_stale if max_stale is not None else self.DEFAULT_MAX_STALE
+        self.fetcher = fetcher
+        self.store = store
+        self._entries = {}
+        self._entries_lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def _entry(self, key) -> _Entry:
+        with self._entries_lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+            return entry
+
+    def _refresh(self, entry: _Entry, api_key: str, limit: int, convert: str):
+        coins = self.fetcher(api_key, limit, convert)
+        entry.coins = coins
+        entry.fetched_at = time.time()
+        api_logger.info(f"CMC listings cached: limit={limit}, convert={convert}, coins={len(coins)}")
+
+        if self.store is not None:
+            try:
+                self.store.write(coins, limit, convert, entry.fetched_at)
+            except Exception as e:
+                debug_logger.warning(f"Failed to write CMC snapshot: {e}")
+
+    def _load_from_store(self, entry: _Entry, limit: int, convert: str):
+        """Warm an empty entry from the latest on-disk snapshot"""
+        if self.store is None:
+            return
+        latest = self.store.latest(limit, convert)
+        if latest is not None:
+            entry.fetched_at, entry.coins = latest
+            debug_logger.info(f"CMC listings loaded from snapshot: limit={limit}, convert={convert}")
+
+    def _refresh_in_background(self, entry: _Entry, api_key: str, limit: int, convert: str):
+        def run():
+            try:
+                with entry.lock:
+                    self._refresh(entry, api_key, limit, convert)
+            except Exception as e:
+                debug_logger.warning(f"Background CMC refresh failed: {e}")
+            finally:
+                entry.refreshing = False
+
+        with self._entries_lock:
+            if entry.refreshing:
+                return
+            entry.refreshing = True
+        threading.Thread(target=run, name='cmc-refresh', daemon=True).start()
+
+    def get(self, api_key: str, limit: int, convert: str = 'USD') -> list:
+        """Listings for (limit, convert); raises CoinMarketCapError if nothing usable"""
+        entry = self._entry((limit, convert))
+
+        if entry.coins is None:
+            with entry.lock:
+                if entry.coins is None:
+                    self._load_from_store(entry, limit, convert)
+
+        age = time.time() - entry.fetched_at
+        if entry.coins is not None and age < self.ttl:
+            self.hits += 1
+            return entry.coins
+
+        if entry.coins is not None and age < self.ttl + self.max_stale:
+            self.stale_hits += 1
+            self._refresh_in_background(entry, api_key, limit, convert)
+            return entry.coins
+
+        with entry.lock:
+            # Another thread may have refreshed while we waited for the lock
+            if entry.coins is not None and time.time() - entry.fetched_at < self.ttl:
+                self.hits += 1
+                return entry.coins
+
+            self.misses += 1
+            self._refresh(entry, api_key, limit, convert)
+            return entry.coins
+
+    def fetched_at(self, limit: int, convert: str = 'USD') -> float:
+        """Fetch time of the listings currently cached for (limit, convert); 0.0 if none"""
+        return self._entry((limit, convert)).fetched_at
+
+    def clear(self):
+        with self._entries_lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Hit/miss counters for monitoring"""
+        return {
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'entries': len(self._entries),
+            'ttl': self.ttl,
+        }
+
+
+# Shared by all traders in this process; persists snapshots unless disabled
+listings_cache = ListingsCache(
+    store=SnapshotStore() if os.getenv('CMC_SNAPSHOTS_ENABLED', 'true').lower() == 'true' else None
+)
@@ -0,0 +1,125 @@
+"""
+On-disk store of CoinMarketCap listings snapshots.
+
+Each listings response is written as a timestamped gzip-compressed JSON
+lines file holding only the fields the allocation code uses.  Warm
+restarts read the latest file instead of calling CMC, and the history can
+be streamed for offline analysis without loading it all into memory.
+
+File layout:
+    <dir>/listings_<limit>_<convert>_<YYYYmmddTHHMMSS>.jsonl.gz
+"""
+import os
+import gzip
+import json
+import time
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+
+debug_logger = logging.getLogger('debug')
+error_logger = logging.getLogger('errors')
+
+DEFAULT_SNAPSHOT_DIR = Path(__file__).resolve().parent.parent / 'data' / 'cmc_snapshots'
+
+TIMESTAMP_FORMAT = '%Y%m%dT%H%M%S'
+
+# Files kept per (limit, convert): one day of history at the default 5-minute cache TTL
+DEFAULT_KEEP = 288
+
+
+def compact_coin(coin: dict, convert: str = 'USD') -> dict:
+    """Keep only the fields used by the allocation code"""
+    quote = coin['quote'][convert]
+    return {
+        's': coin['symbol'],
+        'n': coin.get('name', coin['symbol']),
+        'r': coin['cmc_rank'],
+        'mc': quote['market_cap'],
+        'p': quote['price'],
+        'c24': quote['percent_change_24h'],
+    }
+
+
+def expand_coin(record: dict, convert: str = 'USD') -> dict:
+    """Rebuild the CMC listings shape from a compact record"""
+    return {
+        'symbol': record['s'],
+        'name': record['n'],
+        'cmc_rank': record['r'],
+        'quote': {
+            convert: {
+                'market_cap': record['mc'],
+                'price': record['p'],
+                'percent_change_24h': record['c24'],
+            }
+        }
+    }
+
+
+class SnapshotStore:
+    """Timestamped, compressed CMC listings history"""
+
+    def __init__(self, directory=None, keep: int = None):
+        self.directory = Path(directory or os.getenv('CMC_SNAPSHOT_DIR') or DEFAULT_SNAPSHOT_DIR)
+        # Number of files kept per (limit, convert); 0 (None) keeps everything
+        self.keep = keep if keep is not None else int(os.getenv('CMC_SNAPSHOT_KEEP', DEFAULT_KEEP)) or None
+
+    def _prefix(self, limit: int, convert: str) -> str:
+        return f"listings_{limit}_{convert}_"
+
+    def _timestamp(self, path: Path) -> float:
+        stamp = path.name.rsplit('_', 1)[-1].split('.', 1)[0]
+        return datetime.strptime(stamp, TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc).timestamp()
+
+    def paths(self, limit: int, convert: str = 'USD') -> list:
+        """Snapshot files for (limit, convert), oldest first"""
+        if not self.directory.exists():
+            return []
+        # Timestamps are zero-padded, so lexical order is chronological
+        return sorted(self.directory.glob(f"{self._prefix(limit, convert)}*.jsonl.gz"))
+
+    def write(self, coins: list, limit: int, convert: str = 'USD', fetched_at: float = None):
+        """Persist one listings response"""
+        fetched_at = fetched_at or time.time()
+        stamp = datetime.fromtimestamp(fetched_at, tz=timezone.utc).strftime(TIMESTAMP_FORMAT)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        path = self.directory / f"{self._prefix(limit, convert)}{stamp}.jsonl.gz"
+        tmp_path = path.with_name(path.name + '.tmp')
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            for coin in coins:
+                f.write(json.dumps(compact_coin(coin, convert), separators=(',', ':')))
+                f.write('\n')
+        os.replace(tmp_path, path)
+        debug_logger.info(f"CMC snapshot written: {path.name} ({len(coins)} coins)")
+
+        if self.keep:
+            for old in self.paths(limit, convert)[:-self.keep]:
+                old.unlink(missing_ok=True)
+
+        return path
+
+    def stream(self, path: Path, convert: str = 'USD'):
+        """Yield coins of one snapshot file, one line at a time"""
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield expand_coin(json.loads(line), convert)
+
+    def latest(self, limit: int, convert: str = 'USD'):
+        """(fetched_at, coins) of the newest snapshot, or None"""
+        paths = self.paths(limit, convert)
+        if not paths:
+            return None
+        path = paths[-1]
+        try:
+            return self._timestamp(path), list(self.stream(path, convert))
+        except (OSError, ValueError, KeyError) as e:
+            error_logger.warning(f"Unreadable CMC snapshot {path.name}: {e}")
+            return None
+
+    def history(self, limit: int, convert: str = 'USD'):
+        """Yield (fetched_at, coin iterator) for every snapshot, oldest first"""
+        for path in self.paths(limit, convert):
+            yield self._timestamp(path), self.stream(path, convert)
@@ -0,0 +1,65 @@
+"""
+Drift-band rebalancing.
+
+A portfolio only needs trading once an asset has drifted out of its band
+around the target weight.  DriftBands holds an absolute tolerance (in
+percentage points of portfolio weight) and a relative one (in percent of
+the target weight); an asset is out of band when either is exceeded.
+measure_drift() needs only valued balances and the cached target weights,
+so a probe costs no CMC call and no order planning.  Weights are taken
+over what the planner can move - index assets and the quote currency.
+Holdings outside the target allocation are never traded, so counting them
+would report a drift that no rebalance can correct.
+"""
+import os
+from dataclasses import dataclass
+
+from trader.planner import movable_value
+
+# Cached target weights older than this are not trusted by the probe
+DRIFT_TARGET_MAX_AGE = int(os.getenv('DRIFT_TARGET_MAX_AGE', 86400))
+
+
+@dataclass(frozen=True)
+class DriftBands:
+    """Per-asset tolerance around the target weight"""
+    absolute: float = 5.0     # percentage points, e.g. 60% target -> 55%..65%
+    relative: float = 25.0    # percent of the target, e.g. 8% target -> 6%..10%
+
+    def breached(self, weight: float, target: float) -> bool:
+        deviation = abs(weight - target)
+        if deviation > self.absolute:
+            return True
+        return target > 0 and deviation / target * 100 > self.relative
+
+
+def measure_drift(balances: dict, target_weights: dict, bands: DriftBands, quote_currency: str = None) -> dict:
+    """
+    Compare current weights of the index assets with their target weights.
+
+    Args:
+        balances: get_all_binance_balances()-shaped {asset: {'usdc_value', ...}}
+        target_weights: {asset: weight in percent}
+        quote_currency: stablecoin the planner trades against
+
+    Returns:
+        {'breached': [assets], 'assets': {asset: {'weight', 'target', 'deviation'}},
+         'max_deviation', 'movable_value'}
+    """
+    movable = movable_value(balances, target_weights, quote_currency)
+    assets = {}
+    breached = []
+
+    for asset, target in target_weights.items():
+        value = balances.get(asset, {}).get('usdc_value', 0.0)
+        weight = value / movable * 100 if movable > 0 else 0.0
+        assets[asset] = {'weight': weight, 'target': target, 'deviation': weight - target}
+        if bands.breached(weight, target):
+            breached.append(asset)
+
+    return {
+        'breached': breached,
+        'assets': assets,
+        'max_deviation': max((abs(a['deviation']) for a in assets.values()), default=0.0),
+        'movable_value': movable,
+    }
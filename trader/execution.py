@@ -0,0 +1,210 @@
+"""
+Concurrent order execution helpers.
+
+Orders of one rebalance are fanned out to a small thread pool.  Two pieces
+keep that safe:
+
+- OrderRateLimiter: sliding-window limiter per account that honours the
+  exchange's ORDERS rate limits (from exchangeInfo['rateLimits'])
+- QuoteBudget: quote-currency accounting; sells credit it, buys reserve
+  from it and wait until enough quote is available, so buys never run
+  ahead of the sells that fund them
+
+BalanceLedger tracks the account through the cycle from the fill responses
+themselves, replacing the sleep-and-refetch that used to follow the sells.
+"""
+import os
+import time
+import logging
+import weakref
+import threading
+from collections import deque
+
+debug_logger = logging.getLogger('debug')
+
+ORDER_PARALLELISM = int(os.getenv('ORDER_PARALLELISM', 4))
+# Fraction of the exchange's order limits we allow ourselves to use
+ORDER_RATE_HEADROOM = float(os.getenv('ORDER_RATE_HEADROOM', 0.8))
+# Compare the ledger with get_account() after each live rebalance
+RECONCILE_AFTER_REBALANCE = os.getenv('RECONCILE_AFTER_REBALANCE', 'false').lower() == 'true'
+
+# Used when exchangeInfo is unavailable: Binance spot defaults
+DEFAULT_ORDER_LIMITS = ((50, 10), (160000, 86400))
+
+INTERVAL_SECONDS = {'SECOND': 1, 'MINUTE': 60, 'HOUR': 3600, 'DAY': 86400}
+
+
+def order_limits_from_exchange_info(rate_limits: list) -> tuple:
+    """((max_orders, window_seconds), ...) from exchangeInfo['rateLimits']"""
+    limits = []
+    for rule in rate_limits or []:
+        if rule.get('rateLimitType') != 'ORDERS':
+            continue
+        window = INTERVAL_SECONDS.get(rule.get('interval'), 0) * int(rule.get('intervalNum', 1))
+        if window and rule.get('limit'):
+            limits.append((int(rule['limit']), window))
+    return tuple(limits) or DEFAULT_ORDER_LIMITS
+
+
+class OrderRateLimiter:
+    """Blocks callers so that no window's order count exceeds its limit"""
+
+    def __init__(self, limits=DEFAULT_ORDER_LIMITS, headroom: float = ORDER_RATE_HEADROOM):
+        self.limits = tuple((max(1, int(limit * headroom)), window) for limit, window in limits)
+        self._sent = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Wait for an order slot"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                longest = max(window for _, window in self.limits)
+                while self._sent and now - self._sent[0] > longest:
+                    self._sent.popleft()
+
+                wait = 0.0
+                for limit, window in self.limits:
+                    in_window = [t for t in self._sent if now - t < window]
+                    if len(in_window) >= limit:
+                        wait = max(wait, window - (now - in_window[0]))
+
+                if wait <= 0:
+                    self._sent.append(now)
+                    return
+
+            debug_logger.debug(f"Order rate limit reached, waiting {wait:.2f}s")
+            time.sleep(wait)
+
+
+class QuoteBudget:
+    """Thread-safe quote-currency balance shared by the sell and buy sides"""
+
+    def __init__(self, available: float, pending_sells: int = 0):
+        self.available = available
+        self.pending_sells = pending_sells
+        self._cond = threading.Condition()
+
+    def credit(self, amount: float):
+        """A sell finished: add its proceeds (0 if it failed)"""
+        with self._cond:
+            self.available += amount
+            self.pending_sells -= 1
+            self._cond.notify_all()
+
+    def release(self, amount: float):
+        """Return an unused reservation"""
+        with self._cond:
+            self.available += amount
+            self._cond.notify_all()
+
+    def reserve(self, amount: float) -> bool:
+        """
+        Reserve quote for a buy, waiting for pending sells if needed.
+
+        Returns False once all sells are done and the budget still does not
+        cover the amount.
+        """
+        with self._cond:
+            while amount > self.available and self.pending_sells > 0:
+                self._cond.wait()
+            if amount > self.available:
+                return False
+            self.available -= amount
+            return True
+
+
+_limiters = weakref.WeakKeyDictionary()
+_limiters_lock = threading.Lock()
+
+
+def order_limiter_for(client, limits=DEFAULT_ORDER_LIMITS) -> OrderRateLimiter:
+    """One limiter per client, i.e. per account and endpoint"""
+    with _limiters_lock:
+        limiter = _limiters.get(client)
+        if limiter is None:
+            limiter = _limiters[client] = OrderRateLimiter(limits)
+        return limiter
+
+
+class BalanceLedger:
+    """
+    In-memory per-asset balances updated from fill responses.
+
+    Seeded from the balances fetched at the start of the cycle; every
+    executed order or convert is applied to it, so the rest of the cycle
+    knows what it holds without re-fetching and re-pricing the account.
+    """
+
+    def __init__(self, balances: dict = None):
+        self._lock = threading.Lock()
+        self._totals = {
+            asset: float(data.get('total', 0.0)) for asset, data in (balances or {}).items()
+        }
+
+    def get(self, asset: str) -> float:
+        with self._lock:
+            return self._totals.get(asset, 0.0)
+
+    def _add(self, asset: str, amount: float):
+        self._totals[asset] = self._totals.get(asset, 0.0) + amount
+
+    def apply_order(self, order: dict, base: str, quote: str) -> float:
+        """
+        Apply a FULL market order response.
+
+        Returns:
+            Net quote change (positive for sells, negative for buys)
+        """
+        executed = float(order.get('executedQty', 0.0))
+        quote_qty = float(order.get('cummulativeQuoteQty', 0.0))
+        sign = 1.0 if order.get('side') == 'BUY' else -1.0
+
+        with self._lock:
+            self._add(base, sign * executed)
+            self._add(quote, -sign * quote_qty)
+            quote_delta = -sign * quote_qty
+            for fill in order.get('fills', []):
+                commission = float(fill.get('commission', 0.0))
+                asset = fill.get('commissionAsset')
+                if not commission or not asset:
+                    continue
+                self._add(asset, -commission)
+                if asset == quote:
+                    quote_delta -= commission
+        return quote_delta
+
+    def apply_convert(self, from_asset: str, to_asset: str, from_amount: float, to_amount: float) -> float:
+        """Apply a completed convert; returns the amount received"""
+        with self._lock:
+            self._add(from_asset, -from_amount)
+            self._add(to_asset, to_amount)
+        return to_amount
+
+    def as_balances(self, snapshot=None, stablecoins=()) -> dict:
+        """Balances in the get_all_binance_balances() shape, valued from a price snapshot"""
+        with self._lock:
+            totals = dict(self._totals)
+        balances = {}
+        for asset, total in totals.items():
+            if total <= 0:
+                continue
+            if asset in stablecoins:
+                value = total
+            else:
+                value = snapshot.value(asset, total, stablecoins) if snapshot is not None else 0.0
+            balances[asset] = {'total': total, 'usdc_value': value}
+        return balances
+
+    def diff(self, account_balances: list, tolerance: float = 1e-8) -> dict:
+        """{asset: (ledger, exchange)} where the ledger disagrees with get_account()['balances']"""
+        actual = {
+            b['asset']: float(b['free']) + float(b['locked']) for b in account_balances
+        }
+        with self._lock:
+            assets = set(self._totals) | {a for a, v in actual.items() if v > 0}
+            return {
+                asset: (self._totals.get(asset, 0.0), actual.get(asset, 0.0))
+                for asset in sorted(assets)
+                if abs(self._totals.get(asset, 0.0) - actual.get(asset, 0.0)) > tolerance
+            }
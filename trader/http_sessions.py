@@ -0,0 +1,140 @@
+"""
+Shared outbound HTTP layer.
+
+All outbound calls (CoinMarketCap and Binance) go through one pooled
+keep-alive connection adapter with explicit connect/read timeouts, and
+per-host latency is recorded for monitoring.  Binance requests pass the
+shared request-weight governor on their way through the adapter.
+"""
+import os
+import logging
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from trader.request_governor import governor
+
+perf_logger = logging.getLogger('performance')
+
+CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 15))
+DEFAULT_TIMEOUT = (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', 10))
+POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 50))
+
+# Requests slower than this are logged to the performance log
+SLOW_REQUEST_SECONDS = float(os.getenv('HTTP_SLOW_REQUEST_SECONDS', 2))
+
+
+class HostLatencyStats:
+    """Thread-safe per-host request latency counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def record(self, host: str, seconds: float):
+        with self._lock:
+            stats = self._hosts.get(host)
+            if stats is None:
+                stats = self._hosts[host] = {
+                    'count': 0, 'total': 0.0, 'max': 0.0, 'last': 0.0, 'ewma': seconds
+                }
+            stats['count'] += 1
+            stats['total'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+            stats['last'] = seconds
+            stats['ewma'] = 0.8 * stats['ewma'] + 0.2 * seconds
+
+        if seconds >= SLOW_REQUEST_SECONDS:
+            perf_logger.warning(f"Slow outbound request to {host}: {seconds:.2f}s")
+
+    def snapshot(self) -> dict:
+        """{host: {'count', 'avg', 'max', 'last', 'ewma'}} in seconds"""
+        with self._lock:
+            return {
+                host: {
+                    'count': s['count'],
+                    'avg': s['total'] / s['count'] if s['count'] else 0.0,
+                    'max': s['max'],
+                    'last': s['last'],
+                    'ewma': s['ewma'],
+                }
+                for host, s in self._hosts.items()
+            }
+
+
+latency = HostLatencyStats()
+
+class GovernedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that charges Binance requests against the weight governor"""
+
+    def send(self, request, **kwargs):
+        proxies = kwargs.get('proxies') or {}
+        proxy = proxies.get(urlsplit(request.url).scheme)
+        governor.acquire(request.url, proxy)
+        response = super().send(request, **kwargs)
+        governor.observe(request.url, response.status_code, response.headers, proxy)
+        return response
+
+
+# One adapter = one urllib3 PoolManager: connections are pooled per host,
+# and per proxy URL when a proxy is used. Adapters are safe to share
+# between sessions, so per-client headers (API keys) never leak.
+_shared_adapter = GovernedHTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _record_latency(response, *args, **kwargs):
+    host = urlsplit(response.url).netloc
+    latency.record(host, response.elapsed.total_seconds())
+
+
+def mount_shared_pool(session: requests.Session) -> requests.Session:
+    """Route a session through the shared connection pool and latency hook"""
+    session.mount('https://', _shared_adapter)
+    session.mount('http://', _shared_adapter)
+    if _record_latency not in session.hooks['response']:
+        session.hooks['response'].append(_record_latency)
+    return session
+
+
+def proxy_url_from_config(proxy_config):
+    """socks5:// URL from a profile proxy config dict, or None"""
+    if not proxy_config or not proxy_config.get('host') or not proxy_config.get('port'):
+        return None
+    if proxy_config.get('user') and proxy_config.get('password'):
+        return (f"socks5://{proxy_config['user']}:{proxy_config['password']}"
+                f"@{proxy_config['host']}:{proxy_config['port']}")
+    return f"socks5://{proxy_config['host']}:{proxy_config['port']}"
+
+
+def get_session(proxy_url: str = None) -> requests.Session:
+    """Shared keep-alive session for a proxy configuration (None = direct)"""
+    with _sessions_lock:
+        session = _sessions.get(proxy_url)
+        if session is None:
+            session = mount_shared_pool(requests.Session())
+            if proxy_url:
+                session.proxies.update({'http': proxy_url, 'https': proxy_url})
+            _sessions[proxy_url] = session
+        return session
+
+
+def request(method: str, url: str, proxy_url: str = None, **kwargs) -> requests.Response:
+    """Pooled request with default timeouts"""
+    kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+    return get_session(proxy_url).request(method, url, **kwargs)
+
+
+def binance_requests_params(proxy_url: str = None) -> dict:
+    """requests_params for python-binance Client: timeouts and optional proxy"""
+    params = {'timeout': DEFAULT_TIMEOUT}
+    if proxy_url:
+        params['proxies'] = {'http': proxy_url, 'https': proxy_url}
+    return params
@@ -0,0 +1,476 @@
+"""
+Market data helpers shared by the trader.
+
+Builds in-memory indexes from bulk Binance endpoints so that valuation and
+order planning do not need one HTTP request per asset.
+"""
+import os
+import time
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal, ROUND_DOWN
+from urllib.parse import urlsplit
+
+from trader.request_governor import governor
+
+api_logger = logging.getLogger('api')
+debug_logger = logging.getLogger('debug')
+
+
+class ExchangeInfoUnavailable(Exception):
+    """exchangeInfo could not be loaded, so orders cannot be validated"""
+
+
+def endpoint_key(client) -> str:
+    """REST base URL the client actually talks to (testnet clients keep the production API_URL)"""
+    if getattr(client, 'testnet', False):
+        return getattr(client, 'API_TESTNET_URL', 'testnet')
+    return getattr(client, 'API_URL', 'default')
+
+
+class PriceSnapshot:
+    """
+    Immutable symbol -> price index built from a single bulk ticker call.
+
+    Usage:
+        snapshot = PriceSnapshot.fetch(client)
+        snapshot.get('BTCUSDC')            # 65000.0 or None
+        snapshot.usd_price('SOL')          # via SOLUSDC / SOLUSDT / SOLBTC
+    """
+
+    # Quote currencies tried (in order) when pricing an asset in USD
+    USD_QUOTES = ('USDC', 'USDT')
+
+    def __init__(self, prices: dict, taken_at: float = None, source: str = 'rest'):
+        self._prices = dict(prices)
+        self.taken_at = taken_at if taken_at is not None else time.time()
+        self.source = source  # 'rest' (bulk ticker) or 'stream' (price feed book)
+
+    @classmethod
+    def fetch(cls, client) -> 'PriceSnapshot':
+        """Fetch every symbol price with one /api/v3/ticker/price request"""
+        tickers = client.get_all_tickers()
+        prices = {}
+        for ticker in tickers:
+            try:
+                prices[ticker['symbol']] = float(ticker['price'])
+            except (KeyError, TypeError, ValueError):
+                continue
+
+        api_logger.info(f"Price snapshot fetched: {len(prices)} symbols")
+        return cls(prices)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self._prices
+
+    def __len__(self) -> int:
+        return len(self._prices)
+
+    @property
+    def age(self) -> float:
+        """Seconds since the snapshot was taken"""
+        return time.time() - self.taken_at
+
+    def get(self, symbol: str, default=None):
+        """Raw price of a trading pair, e.g. 'ETHBTC'"""
+        return self._prices.get(symbol, default)
+
+    def usd_price(self, asset: str, stablecoins=()) -> float:
+        """
+        Price of an asset in USD using the same fallback order as before:
+        {asset}USDC -> {asset}USDT -> {asset}BTC * BTCUSDC.
+
+        Returns 0.0 when the asset cannot be priced.
+        """
+        if asset in stablecoins:
+            return 1.0
+
+        for quote in self.USD_QUOTES:
+            price = self._prices.get(f"{asset}{quote}")
+            if price:
+                return price
+
+        btc_cross = self._prices.get(f"{asset}BTC")
+        if btc_cross:
+            btc_usd = self._prices.get('BTCUSDC') or self._prices.get('BTCUSDT')
+            if btc_usd:
+                return btc_cross * btc_usd
+
+        return 0.0
+
+    def value(self, asset: str, quantity: float, stablecoins=()) -> float:
+        """USD value of a quantity of an asset"""
+        return quantity * self.usd_price(asset, stablecoins)
+
+    def as_dict(self) -> dict:
+        """Copy of the underlying symbol -> price mapping"""
+        return dict(self._prices)
+
+    def record(self, assets, stablecoins=()) -> dict:
+        """JSON-friendly summary for results: when, from where, and the USD prices of `assets`"""
+        return {
+            'taken_at': datetime.fromtimestamp(self.taken_at).isoformat(),
+            'source': self.source,
+            'prices': {asset: self.usd_price(asset, stablecoins) for asset in sorted(set(assets))},
+        }
+
+
+def _decimals(step: str) -> int:
+    """Number of decimal places in a Binance step string, e.g. '0.00100000' -> 3"""
+    if '.' not in step:
+        return 0
+    return len(step.rstrip('0').split('.')[1])
+
+
+@dataclass(frozen=True)
+class SymbolFilters:
+    """Pre-parsed exchange filters of a single trading pair"""
+    symbol: str
+    base_asset: str
+    quote_asset: str
+    status: str
+    step_size: Decimal = Decimal('0')
+    min_qty: float = 0.0
+    max_qty: float = 0.0
+    market_step_size: Decimal = Decimal('0')
+    market_min_qty: float = 0.0
+    market_max_qty: float = 0.0
+    min_notional: float = 0.0
+    min_notional_applies_to_market: bool = True
+    tick_size: Decimal = Decimal('0')
+    quantity_precision: int = 8
+    price_precision: int = 8
+
+    @property
+    def is_trading(self) -> bool:
+        return self.status == 'TRADING'
+
+    @classmethod
+    def from_symbol_info(cls, info: dict) -> 'SymbolFilters':
+        """Parse one entry of exchangeInfo['symbols']"""
+        fields = {
+            'symbol': info['symbol'],
+            'base_asset': info.get('baseAsset', ''),
+            'quote_asset': info.get('quoteAsset', ''),
+            'status': info.get('status', ''),
+        }
+
+        for f in info.get('filters', []):
+            filter_type = f.get('filterType')
+
+            if filter_type == 'LOT_SIZE':
+                fields['step_size'] = Decimal(f['stepSize'])
+                fields['min_qty'] = float(f['minQty'])
+                fields['max_qty'] = float(f['maxQty'])
+                fields['quantity_precision'] = _decimals(f['stepSize'])
+            elif filter_type == 'MARKET_LOT_SIZE':
+                fields['market_step_size'] = Decimal(f['stepSize'])
+                fields['market_min_qty'] = float(f['minQty'])
+                fields['market_max_qty'] = float(f['maxQty'])
+            elif filter_type == 'MIN_NOTIONAL':
+                fields['min_notional'] = float(f['minNotional'])
+                fields['min_notional_applies_to_market'] = bool(f.get('applyToMarket', True))
+            elif filter_type == 'NOTIONAL':
+                # Newer replacement of MIN_NOTIONAL
+                fields['min_notional'] = float(f['minNotional'])
+                fields['min_notional_applies_to_market'] = bool(f.get('applyMinToMarket', True))
+            elif filter_type == 'PRICE_FILTER':
+                fields['tick_size'] = Decimal(f['tickSize'])
+                fields['price_precision'] = _decimals(f['tickSize'])
+
+        return cls(**fields)
+
+    def round_quantity(self, quantity: float, market: bool = True) -> float:
+        """Floor a quantity to the pair's step size (MARKET_LOT_SIZE for market orders)"""
+        step = self.market_step_size if market and self.market_step_size > 0 else self.step_size
+        if step <= 0:
+            return quantity
+        steps = (Decimal(str(quantity)) / step).to_integral_value(rounding=ROUND_DOWN)
+        return float(steps * step)
+
+
+class ExchangeInfoCache:
+    """
+    Process-wide exchangeInfo cache with a per-pair filter index.
+
+    One instance exists per API endpoint (Binance.com, Binance.US, testnet);
+    every trader talking to that endpoint shares it.  The full exchangeInfo
+    payload is loaded once and reloaded after `ttl` seconds.
+    """
+
+    DEFAULT_TTL = int(os.getenv('BINANCE_EXCHANGE_INFO_TTL', 3600))
+    # After a failed load, callers use what is cached (if anything) until this many seconds pass
+    RETRY_AFTER = int(os.getenv('BINANCE_EXCHANGE_INFO_RETRY', 60))
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, ttl: int = None):
+        self.ttl = ttl if ttl is not None else self.DEFAULT_TTL
+        self._filters = {}
+        self._loaded_at = 0.0
+        self._failed_at = 0.0
+        self._lock = threading.Lock()
+        self._listeners = []
+        self.rate_limits = []
+
+    @classmethod
+    def shared(cls, client) -> 'ExchangeInfoCache':
+        """Cache shared by all clients that talk to the same endpoint"""
+        key = endpoint_key(client)
+        with cls._instances_lock:
+            cache = cls._instances.get(key)
+            if cache is None:
+                cache = cls._instances[key] = cls()
+            return cache
+
+    @property
+    def is_stale(self) -> bool:
+        return not self._filters or time.time() - self._loaded_at >= self.ttl
+
+    @property
+    def loaded(self) -> bool:
+        """True once exchangeInfo has been loaded at least once"""
+        return bool(self._filters)
+
+    def add_listener(self, callback):
+        """Register callback(filters_by_symbol) invoked after every reload"""
+        self._listeners.append(callback)
+
+    def refresh(self, client):
+        """Reload exchangeInfo and rebuild the filter index"""
+        info = client.get_exchange_info()
+        filters = {}
+        for symbol_info in info.get('symbols', []):
+            try:
+                parsed = SymbolFilters.from_symbol_info(symbol_info)
+            except (KeyError, TypeError, ValueError) as e:
+                debug_logger.debug(f"Skipping symbol {symbol_info.get('symbol')}: {e}")
+                continue
+            filters[parsed.symbol] = parsed
+
+        self._filters = filters
+        self.rate_limits = info.get('rateLimits', [])
+        self._loaded_at = time.time()
+        governor.update_limits(urlsplit(endpoint_key(client)).hostname, self.rate_limits)
+        api_logger.info(f"Exchange info loaded: {len(filters)} symbols")
+
+        for callback in self._listeners:
+            try:
+                callback(filters)
+            except Exception as e:
+                debug_logger.warning(f"Exchange info listener failed: {e}")
+
+    def start_background_refresh(self, client):
+        """Reload exchangeInfo every `ttl` seconds in a daemon thread (idempotent)"""
+        with self._lock:
+            if getattr(self, '_refresh_thread', None) and self._refresh_thread.is_alive():
+                return
+            self._refresh_stopped = threading.Event()
+            self._refresh_thread = threading.Thread(
+                target=self._refresh_loop, args=(client, self._refresh_stopped),
+                name='exchange-info-refresh', daemon=True
+            )
+            self._refresh_thread.start()
+
+    def stop_background_refresh(self, timeout: float = 5):
+        """Stop the refresh thread; returns without waiting out the current ttl"""
+        thread = getattr(self, '_refresh_thread', None)
+        if thread is None:
+            return
+        self._refresh_stopped.set()
+        thread.join(timeout)
+        self._refresh_thread = None
+
+    def _refresh_loop(self, client, stopped):
+        while not stopped.wait(self.ttl):
+            try:
+                with self._lock:
+                    self.refresh(client)
+            except Exception as e:
+                debug_logger.warning(f"Background exchange info refresh failed: {e}")
+
+    @property
+    def backing_off(self) -> bool:
+        """True for RETRY_AFTER seconds after a failed load"""
+        return time.time() - self._failed_at < self.RETRY_AFTER
+
+    def ensure_fresh(self, client):
+        """
+        Reload if the TTL has expired; only one thread performs the reload.
+
+        A failed reload is retried after RETRY_AFTER seconds at the earliest,
+        so an outage does not turn every price lookup into a weight-20 call.
+        """
+        if not self.is_stale or self.backing_off:
+            return
+        with self._lock:
+            if self.is_stale and not self.backing_off:
+                try:
+                    self.refresh(client)
+                except Exception:
+                    self._failed_at = time.time()
+                    raise
+
+    def get(self, client, symbol: str):
+        """SymbolFilters for a pair, or None if the pair is not listed"""
+        self.ensure_fresh(client)
+        return self._filters.get(symbol)
+
+    def peek(self, symbol: str):
+        """SymbolFilters from the current index without triggering a reload"""
+        return self._filters.get(symbol)
+
+    def symbols(self, client) -> dict:
+        """Whole symbol -> SymbolFilters index"""
+        self.ensure_fresh(client)
+        return self._filters
+
+
+@dataclass(frozen=True)
+class Route:
+    """Path used to trade or price `asset` against a USD stablecoin"""
+    asset: str
+    quote: str            # final USD quote currency
+    legs: tuple           # trading pairs, e.g. ('SOLUSDC',) or ('XYZBTC', 'BTCUSDC')
+
+    @property
+    def is_direct(self) -> bool:
+        return len(self.legs) == 1
+
+
+class RoutingTable:
+    """
+    Precomputed base asset -> tradable quote currencies map.
+
+    Built from the shared ExchangeInfoCache and rebuilt automatically every
+    time the cache reloads, so lookups never hit the API and never probe
+    non-existent pairs.
+    """
+
+    # Preferred USD quotes, best first
+    USD_QUOTES = ('USDC', 'USDT', 'FDUSD', 'BUSD')
+    # Intermediate assets for cross routes when no direct USD pair exists
+    CROSS_ASSETS = ('BTC', 'ETH', 'BNB')
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, exchange_info: ExchangeInfoCache):
+        self.exchange_info = exchange_info
+        self._quotes = {}       # base -> [quote, ...] ranked
+        self._routes = {}       # base -> Route (best USD route)
+        self._liquidity = {}    # symbol -> 24h quote volume
+        self.liquidity_updated_at = 0.0
+        self._liquidity_attempted_at = 0.0
+        # Rebuilds come from the exchange info refresh thread and from traders
+        self._lock = threading.RLock()
+        exchange_info.add_listener(self.rebuild)
+        if exchange_info._filters:
+            self.rebuild(exchange_info._filters)
+
+    @classmethod
+    def shared(cls, client) -> 'RoutingTable':
+        """Routing table for the client's endpoint"""
+        exchange_info = ExchangeInfoCache.shared(client)
+        key = endpoint_key(client)
+        with cls._instances_lock:
+            table = cls._instances.get(key)
+            if table is None:
+                table = cls._instances[key] = cls(exchange_info)
+            return table
+
+    def refresh_liquidity(self, client):
+        """
+        Fetch 24h tickers (weight 80) if stale.  The attempt is recorded
+        first, so a failing call is not repeated by every lookup or thread
+        before RETRY_AFTER seconds.
+        """
+        with self._lock:
+            if not self.liquidity_is_stale:
+                return
+            self._liquidity_attempted_at = time.time()
+        self.update_liquidity(client.get_ticker())
+
+    def update_liquidity(self, tickers_24h):
+        """Feed 24h tickers (client.get_ticker()) to rank quotes with equal preference"""
+        liquidity = {
+            t['symbol']: float(t.get('quoteVolume') or 0.0) for t in tickers_24h
+        }
+        with self._lock:
+            self._liquidity = liquidity
+            self.liquidity_updated_at = time.time()
+            if self.exchange_info._filters:
+                self.rebuild(self.exchange_info._filters)
+
+    def _rank(self, base: str, quote: str):
+        if quote in self.USD_QUOTES:
+            preference = self.USD_QUOTES.index(quote)
+        elif quote in self.CROSS_ASSETS:
+            preference = len(self.USD_QUOTES) + self.CROSS_ASSETS.index(quote)
+        else:
+            preference = len(self.USD_QUOTES) + len(self.CROSS_ASSETS)
+        return preference, -self._liquidity.get(f"{base}{quote}", 0.0)
+
+    def rebuild(self, filters_by_symbol: dict):
+        """Rebuild quote rankings and best routes from a filter index"""
+        with self._lock:
+            self._rebuild(filters_by_symbol)
+
+    def _rebuild(self, filters_by_symbol: dict):
+        quotes = {}
+        for f in filters_by_symbol.values():
+            if f.is_trading:
+                quotes.setdefault(f.base_asset, []).append(f.quote_asset)
+
+        for base, base_quotes in quotes.items():
+            base_quotes.sort(key=lambda q, b=base: self._rank(b, q))
+
+        routes = {}
+        for base, base_quotes in quotes.items():
+            usd = [q for q in base_quotes if q in self.USD_QUOTES]
+            if usd:
+                routes[base] = Route(base, usd[0], (f"{base}{usd[0]}",))
+                continue
+            for cross in self.CROSS_ASSETS:
+                if cross not in base_quotes:
+                    continue
+                cross_usd = [q for q in quotes.get(cross, []) if q in self.USD_QUOTES]
+                if cross_usd:
+                    routes[base] = Route(base, cross_usd[0], (f"{base}{cross}", f"{cross}{cross_usd[0]}"))
+                    break
+
+        self._quotes = quotes
+        self._routes = routes
+        debug_logger.info(f"Routing table rebuilt: {len(quotes)} assets, {len(routes)} USD routes")
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self._quotes)
+
+    @property
+    def liquidity_is_stale(self) -> bool:
+        now = time.time()
+        return (now - self.liquidity_updated_at >= self.exchange_info.ttl
+                and now - self._liquidity_attempted_at >= self.exchange_info.RETRY_AFTER)
+
+    def quotes(self, base: str) -> list:
+        """Tradable quote currencies of an asset, best first"""
+        return self._quotes.get(base, [])
+
+    def has_pair(self, base: str, quote: str) -> bool:
+        return quote in self._quotes.get(base, ())
+
+    def direct_quote(self, base: str, allowed=None):
+        """Best directly tradable quote among `allowed` (default: USD quotes), or None"""
+        allowed = allowed or self.USD_QUOTES
+        for quote in self._quotes.get(base, ()):
+            if quote in allowed:
+                return quote
+        return None
+
+    def route(self, base: str):
+        """Best Route from an asset to a USD stablecoin, or None"""
+        return self._routes.get(base)
@@ -0,0 +1,151 @@
+"""
+Cost-minimising rebalance planning.
+
+The naive plan routes every change through the quote stablecoin: each
+over-weight asset is sold for quote and each under-weight asset is bought
+with it, two orders and two fees per unit of value moved.  Netting treats
+the plan as a flow from surplus assets to deficit assets over the
+tradable-pair graph and sends as much of it as possible over direct pairs
+such as ETHBTC, where one order and one fee do the job of both legs.
+Whatever cannot be routed directly stays on the quote legs.
+"""
+import os
+from collections import deque
+from dataclasses import dataclass
+
+# Taker fee used to estimate the cost of a plan (Binance spot default)
+TRADING_FEE_RATE = float(os.getenv('TRADING_FEE_RATE', 0.001))
+# Route surplus -> deficit value over direct cross pairs when possible
+CROSS_PAIR_ROUTING = os.getenv('CROSS_PAIR_ROUTING', 'true').lower() == 'true'
+# Stablecoins the trader can quote orders in, in order of preference
+QUOTE_CURRENCIES = ('USDC', 'USDT', 'BUSD', 'FDUSD')
+
+
+@dataclass(frozen=True)
+class CrossFlow:
+    """Value moved from one asset to another over a direct pair"""
+    from_asset: str
+    to_asset: str
+    value: float        # USD
+    pair: str
+    base: str
+    quote: str
+
+    @property
+    def side(self) -> str:
+        """Order side on `pair`: selling the base or buying it"""
+        return 'SELL' if self.from_asset == self.base else 'BUY'
+
+
+def max_cross_flows(surplus: dict, deficit: dict, pair_for) -> list:
+    """
+    Largest total value that can move from surplus to deficit assets over
+    direct pairs (max flow on the bipartite surplus/deficit graph).
+
+    Args:
+        surplus: {asset: USD value to sell}
+        deficit: {asset: USD value to buy}
+        pair_for: callable(from_asset, to_asset) -> (pair, base, quote) or None
+
+    Returns:
+        [CrossFlow], largest first
+    """
+    pairs = {
+        (s, d): pair_for(s, d) for s in surplus for d in deficit if s != d
+    }
+    pairs = {edge: pair for edge, pair in pairs.items() if pair is not None}
+    if not pairs:
+        return []
+
+    source_left = dict(surplus)
+    sink_left = dict(deficit)
+    flow = {edge: 0.0 for edge in pairs}
+    adjacent = {}
+    for s, d in pairs:
+        adjacent.setdefault(s, []).append(d)
+
+    def augmenting_path():
+        # BFS source -> s -> d -> sink; a d -> s step cancels flow already sent
+        parents = {}
+        queue = deque(s for s, left in source_left.items() if left > 0)
+        seen = {('s', s) for s in queue}
+        for s in queue:
+            parents[('s', s)] = None
+        while queue:
+            s = queue.popleft()
+            for d in adjacent.get(s, ()):
+                node = ('d', d)
+                if node in seen:
+                    continue
+                seen.add(node)
+                parents[node] = ('s', s)
+                if sink_left[d] > 0:
+                    return node, parents
+                for back_s, back_d in flow:
+                    if back_d == d and flow[(back_s, d)] > 0 and ('s', back_s) not in seen:
+                        seen.add(('s', back_s))
+                        parents[('s', back_s)] = node
+                        queue.append(back_s)
+        return None, parents
+
+    while True:
+        end, parents = augmenting_path()
+        if end is None:
+            break
+
+        # Walk back to find the bottleneck, then push it along the path
+        path = []
+        node = end
+        while parents[node] is not None:
+            path.append((parents[node], node))
+            node = parents[node]
+        start = node[1]
+
+        amount = min(source_left[start], sink_left[end[1]])
+        for prev, nxt in path:
+            if prev[0] == 's':
+                continue
+            amount = min(amount, flow[(nxt[1], prev[1])])
+
+        source_left[start] -= amount
+        sink_left[end[1]] -= amount
+        for prev, nxt in path:
+            if prev[0] == 's':
+                flow[(prev[1], nxt[1])] += amount
+            else:
+                flow[(nxt[1], prev[1])] -= amount
+
+    flows = [
+        CrossFlow(s, d, value, *pairs[(s, d)])
+        for (s, d), value in flow.items() if value > 0
+    ]
+    return sorted(flows, key=lambda f: f.value, reverse=True)
+
+
+def select_quote_currency(balances: dict) -> tuple:
+    """First quote stablecoin with a usable balance: (asset, balance), USDC if none"""
+    for stable in QUOTE_CURRENCIES:
+        balance = balances.get(stable, {}).get('total', 0)
+        if balance > 0.1:
+            return stable, balance
+    return 'USDC', 0
+
+
+def movable_value(balances: dict, index_assets, quote_currency: str = None) -> float:
+    """
+    USD value the planner can rebalance: the index assets plus the quote
+    currency orders are placed in.  Other holdings, other stablecoins
+    included, are never traded, so targets are not computed on them.
+    """
+    assets = set(index_assets)
+    if quote_currency:
+        assets.add(quote_currency)
+    return sum(balances.get(asset, {}).get('usdc_value', 0.0) for asset in assets)
+
+
+def plan_cost(operations: dict, fee_rate: float = TRADING_FEE_RATE) -> dict:
+    """Order count and estimated fees of a plan's market and cross orders"""
+    legs = [data['value_usdc'] for data in operations.get('sell_orders', {}).values()]
+    legs += [data['value_usdc'] for data in operations.get('buy_orders', {}).values()]
+    legs += [data['value_usdc'] for data in operations.get('cross_orders', {}).values()]
+    return {'orders': len(legs), 'traded_value': sum(legs), 'fees': sum(legs) * fee_rate}
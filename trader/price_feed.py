@@ -0,0 +1,167 @@
+"""
+Streaming market data.
+
+MarketDataFeed subscribes to Binance's all-market mini-ticker stream and
+keeps an in-memory PriceBook that valuation and order planning read
+without any HTTP request.  When the stream is down or stale, callers fall
+back to REST snapshots; symbols not yet seen on the current connection are
+filled in from REST the same way.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+
+try:
+    import websockets
+except ImportError:  # installed with python-binance; optional otherwise
+    websockets = None
+
+from trader.market_data import PriceSnapshot, endpoint_key
+
+api_logger = logging.getLogger('api')
+debug_logger = logging.getLogger('debug')
+error_logger = logging.getLogger('errors')
+
+STREAM_ENABLED = os.getenv('MARKET_DATA_STREAM_ENABLED', 'true').lower() == 'true'
+# The stream is treated as down when no message arrived for this long
+STALE_AFTER = float(os.getenv('MARKET_DATA_STALE_SECONDS', 10))
+
+# REST API URL prefix -> all-market mini-ticker stream
+STREAM_URLS = {
+    'https://api.binance.com': 'wss://stream.binance.com:9443/ws/!miniTicker@arr',
+    'https://api.binance.us': 'wss://stream.binance.us:9443/ws/!miniTicker@arr',
+    'https://testnet.binance.vision': 'wss://testnet.binance.vision/ws/!miniTicker@arr',
+}
+
+
+class PriceBook:
+    """
+    symbol -> (price, updated_at) map written by a single feed thread.
+
+    Readers never take a lock: each entry is replaced by one dict item
+    assignment, which is atomic, so a reader sees either the old or the
+    new tuple.
+
+    The mini-ticker stream only carries symbols whose price changed, so a
+    quiet symbol keeps its last price for as long as the connection is
+    alive.  Freshness is judged from the stream itself: the book is stale
+    when no message has arrived for STALE_AFTER seconds, and prices written
+    before the current connection began are not trusted, since they may
+    have moved while it was down.
+    """
+
+    def __init__(self):
+        self._prices = {}
+        self.updated_at = 0.0    # last message (the stream's heartbeat)
+        self.valid_since = 0.0   # start of the current connection
+
+    def update(self, symbol: str, price: float, at: float = None):
+        at = at or time.time()
+        self._prices[symbol] = (price, at)
+        self.updated_at = at
+
+    def mark_connected(self, at: float = None):
+        """Distrust prices received before a (re)connect"""
+        self.valid_since = at or time.time()
+
+    def get(self, symbol: str):
+        """Current price of a pair or None (stale book or not seen on this connection)"""
+        entry = self._prices.get(symbol)
+        if entry is None or entry[1] < self.valid_since or self.is_stale:
+            return None
+        return entry[0]
+
+    @property
+    def is_stale(self) -> bool:
+        return time.time() - self.updated_at > STALE_AFTER
+
+    def snapshot(self) -> PriceSnapshot:
+        """Immutable PriceSnapshot of every price seen on the current connection"""
+        since = self.valid_since
+        prices = {symbol: price for symbol, (price, at) in list(self._prices.items()) if at >= since}
+        return PriceSnapshot(prices, taken_at=self.updated_at, source='stream')
+
+    def __len__(self) -> int:
+        return len(self._prices)
+
+
+class MarketDataFeed:
+    """Mini-ticker stream consumer running in its own daemon thread"""
+
+    RECONNECT_DELAY_MAX = 60
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, url: str):
+        self.url = url
+        self.book = PriceBook()
+        self.connected = False
+        self.messages = 0
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, client):
+        """Feed for the client's endpoint, or None if streaming is unavailable"""
+        if not STREAM_ENABLED or websockets is None:
+            return None
+        api_url = endpoint_key(client)
+        url = next((stream for prefix, stream in STREAM_URLS.items() if api_url.startswith(prefix)), None)
+        if url is None:
+            return None
+        with cls._instances_lock:
+            feed = cls._instances.get(url)
+            if feed is None:
+                feed = cls._instances[url] = cls(url)
+            return feed
+
+    @property
+    def is_stale(self) -> bool:
+        return not self.connected or self.book.is_stale
+
+    def start(self):
+        """Start the stream thread (idempotent)"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._thread_main, name='market-data-feed', daemon=True)
+            self._thread.start()
+
+    def _thread_main(self):
+        asyncio.run(self._run())
+
+    def handle_message(self, message):
+        """Apply a mini-ticker payload (single event or array) to the price book"""
+        events = json.loads(message)
+        if isinstance(events, dict):
+            events = [events]
+        now = time.time()
+        for event in events:
+            try:
+                self.book.update(event['s'], float(event['c']), now)
+            except (KeyError, TypeError, ValueError):
+                continue
+        self.messages += 1
+
+    async def _run(self):
+        delay = 1
+        while True:
+            try:
+                async with websockets.connect(self.url, ping_interval=20, close_timeout=5) as ws:
+                    self.book.mark_connected()
+                    self.connected = True
+                    delay = 1
+                    api_logger.info(f"Market data stream connected: {self.url}")
+                    async for message in ws:
+                        self.handle_message(message)
+            except Exception as e:
+                error_logger.warning(f"Market data stream error ({self.url}): {e}")
+            finally:
+                self.connected = False
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.RECONNECT_DELAY_MAX)
@@ -0,0 +1,220 @@
+"""
+Process-wide Binance request-weight governor.
+
+Binance limits REQUEST_WEIGHT per IP per minute, shared by every account
+served from this host; going over it gets the IP a 429 and then a 418 ban
+for all tenants.  The governor sits in the shared HTTP adapter and:
+
+- charges each request its documented weight before it is sent, and
+  blocks the caller until the current minute has room
+- corrects its estimate from the X-MBX-USED-WEIGHT-1M response header
+- honours Retry-After on 429/418 by holding every request to that host
+
+Budgets are kept per (host, proxy), since requests through a proxy come
+from another IP.  stats() exposes current utilisation for monitoring.
+"""
+import os
+import time
+import hashlib
+import logging
+import threading
+from urllib.parse import urlsplit, parse_qs
+
+perf_logger = logging.getLogger('performance')
+error_logger = logging.getLogger('errors')
+
+DEFAULT_WEIGHT_LIMIT = int(os.getenv('BINANCE_WEIGHT_LIMIT', 6000))
+# Fraction of the weight limit we allow ourselves to use
+WEIGHT_HEADROOM = float(os.getenv('BINANCE_WEIGHT_HEADROOM', 0.8))
+
+GOVERNED_HOSTS = (
+    'api.binance.com', 'api1.binance.com', 'api2.binance.com', 'api3.binance.com', 'api4.binance.com',
+    'api.binance.us', 'testnet.binance.vision',
+)
+
+USED_WEIGHT_HEADER = 'X-MBX-USED-WEIGHT-1M'
+
+DEFAULT_WEIGHT = 2
+# path -> (weight with a symbol / single item, weight without)
+ENDPOINT_WEIGHTS = {
+    '/api/v3/ping': (1, 1),
+    '/api/v3/time': (1, 1),
+    '/api/v3/exchangeInfo': (20, 20),
+    '/api/v3/account': (20, 20),
+    '/api/v3/order': (1, 1),
+    '/api/v3/openOrders': (6, 80),
+    '/api/v3/ticker/price': (2, 4),
+    '/api/v3/ticker/bookTicker': (2, 4),
+    '/api/v3/ticker/24hr': (2, 80),
+    '/api/v3/userDataStream': (2, 2),
+}
+
+
+def endpoint_weight(path: str, query: str = '') -> int:
+    """Request weight of a REST call; symbol-less ticker calls are heavier"""
+    weights = ENDPOINT_WEIGHTS.get(path)
+    if weights is None:
+        return DEFAULT_WEIGHT
+    params = parse_qs(query)
+    return weights[0] if ('symbol' in params or 'symbols' in params) else weights[1]
+
+
+class _WeightBudget:
+    __slots__ = ('limit', 'minute', 'used', 'blocked_until', 'requests', 'waits',
+                 'wait_seconds', 'rejections', 'peak')
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.minute = 0
+        self.used = 0
+        self.blocked_until = 0.0
+        self.requests = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.rejections = 0
+        self.peak = 0
+
+    def roll(self, now: float):
+        # Binance weight windows are calendar minutes
+        minute = int(now // 60)
+        if minute != self.minute:
+            self.minute = minute
+            self.used = 0
+
+
+class RequestWeightGovernor:
+    """Blocks Binance requests that would exceed the shared weight budget"""
+
+    def __init__(self, limit: int = DEFAULT_WEIGHT_LIMIT, headroom: float = WEIGHT_HEADROOM,
+                 hosts=GOVERNED_HOSTS):
+        self.limit = limit
+        self.headroom = headroom
+        self.hosts = set(hosts)
+        self._limits = {}  # host -> limit reported by exchangeInfo
+        self._budgets = {}
+        self._cond = threading.Condition()
+
+    def _budget(self, key) -> _WeightBudget:
+        budget = self._budgets.get(key)
+        if budget is None:
+            budget = self._budgets[key] = _WeightBudget(self._limits.get(key[0], self.limit))
+        return budget
+
+    def update_limits(self, host: str, rate_limits: list):
+        """Apply REQUEST_WEIGHT per-minute limit from exchangeInfo['rateLimits']"""
+        for rule in rate_limits or []:
+            if (rule.get('rateLimitType') == 'REQUEST_WEIGHT' and rule.get('interval') == 'MINUTE'
+                    and int(rule.get('intervalNum', 1)) == 1):
+                limit = int(rule['limit'])
+                with self._cond:
+                    self._limits[host] = limit
+                    for (budget_host, _), budget in self._budgets.items():
+                        if budget_host == host:
+                            budget.limit = limit
+                    self._cond.notify_all()
+                return
+
+    def acquire(self, url: str, proxy: str = None) -> int:
+        """
+        Charge a request's weight, waiting until the budget allows it.
+
+        Returns:
+            The weight charged (0 for hosts that are not governed)
+        """
+        parts = urlsplit(url)
+        if parts.hostname not in self.hosts:
+            return 0
+
+        weight = endpoint_weight(parts.path, parts.query)
+        key = (parts.hostname, proxy)
+        started = time.monotonic()
+        waited = 0.0
+
+        with self._cond:
+            budget = self._budget(key)
+            while True:
+                now = time.time()
+                budget.roll(now)
+                allowed = int(budget.limit * self.headroom)
+
+                if now < budget.blocked_until:
+                    wait = budget.blocked_until - now
+                elif budget.used + weight > allowed and budget.used > 0:
+                    wait = (budget.minute + 1) * 60 - now
+                else:
+                    budget.used += weight
+                    budget.requests += 1
+                    budget.peak = max(budget.peak, budget.used)
+                    if waited:
+                        budget.waits += 1
+                        budget.wait_seconds += waited
+                    return weight
+
+                if not waited:
+                    perf_logger.warning(
+                        f"Binance weight budget exhausted for {parts.hostname} "
+                        f"({budget.used}/{allowed}), delaying {parts.path} by {wait:.1f}s"
+                    )
+                # Re-check at least every second: limits can change and bans can be extended
+                self._cond.wait(min(wait, 1.0))
+                waited = time.monotonic() - started
+
+    def observe(self, url: str, status_code: int, headers, proxy: str = None):
+        """Correct the estimate from a response"""
+        host = urlsplit(url).hostname
+        if host not in self.hosts:
+            return
+
+        with self._cond:
+            budget = self._budget((host, proxy))
+            budget.roll(time.time())
+
+            used = headers.get(USED_WEIGHT_HEADER)
+            if used is not None:
+                try:
+                    # Other processes on this IP count too: never go below the server's figure
+                    budget.used = max(budget.used, int(used))
+                    budget.peak = max(budget.peak, budget.used)
+                except ValueError:
+                    pass
+
+            if status_code in (418, 429):
+                retry_after = headers.get('Retry-After')
+                try:
+                    delay = float(retry_after) if retry_after is not None else 60.0
+                except ValueError:
+                    delay = 60.0
+                budget.blocked_until = max(budget.blocked_until, time.time() + delay)
+                budget.rejections += 1
+                error_logger.error(
+                    f"Binance rate limit hit ({status_code}) on {host}, holding requests for {delay:.0f}s"
+                )
+
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        """{'host|direct' or 'host|proxy:<hash>': {'used', 'limit', 'utilisation', ...}} for the current minute"""
+        now = time.time()
+        with self._cond:
+            result = {}
+            for (host, proxy), budget in self._budgets.items():
+                budget.roll(now)
+                # Proxy URLs may carry credentials, so budgets are told apart by a hash
+                route = f"proxy:{hashlib.sha256(proxy.encode()).hexdigest()[:12]}" if proxy else 'direct'
+                result[f"{host}|{route}"] = {
+                    'used': budget.used,
+                    'limit': budget.limit,
+                    'allowed': int(budget.limit * self.headroom),
+                    'utilisation': budget.used / budget.limit if budget.limit else 0.0,
+                    'peak': budget.peak,
+                    'requests': budget.requests,
+                    'delayed_requests': budget.waits,
+                    'delay_seconds': budget.wait_seconds,
+                    'rejections': budget.rejections,
+                    'blocked_for': max(0.0, budget.blocked_until - now),
+                }
+            return result
+
+
+# Shared by every Binance client in this process
+governor = RequestWeightGovernor()
@@ -0,0 +1,229 @@
+"""
+Binance user data stream.
+
+UserDataStream keeps one account's balances in memory: the book is seeded
+with a single get_account() call when the stream connects and is then
+updated incrementally from outboundAccountPosition, balanceUpdate and
+executionReport events.  The listenKey is renewed in the background.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import weakref
+import threading
+from collections import OrderedDict
+
+try:
+    import websockets
+except ImportError:  # installed with python-binance; optional otherwise
+    websockets = None
+
+from trader.market_data import endpoint_key
+
+api_logger = logging.getLogger('api')
+debug_logger = logging.getLogger('debug')
+error_logger = logging.getLogger('errors')
+
+USER_STREAM_ENABLED = os.getenv('USER_DATA_STREAM_ENABLED', 'true').lower() == 'true'
+# listenKeys expire after 60 minutes without a keepalive
+LISTEN_KEY_KEEPALIVE = int(os.getenv('USER_DATA_STREAM_KEEPALIVE', 1800))
+
+# REST API URL prefix -> user data stream base URL (listenKey is appended)
+USER_STREAM_URLS = {
+    'https://api.binance.com': 'wss://stream.binance.com:9443/ws/',
+    'https://api.binance.us': 'wss://stream.binance.us:9443/ws/',
+    'https://testnet.binance.vision': 'wss://testnet.binance.vision/ws/',
+}
+
+
+class AccountBalanceBook:
+    """
+    asset -> (free, locked) map of one account, written by the stream thread.
+
+    Like PriceBook, readers take no lock: the balances dict is replaced as a
+    whole on seed and entries are replaced one item at a time on events.
+    """
+
+    MAX_ORDERS = 500
+
+    def __init__(self):
+        self._balances = {}
+        self.orders = OrderedDict()  # orderId -> last executionReport
+        self.seeded = False
+        self.updated_at = 0.0
+        self.last_event_time = 0
+
+    def seed(self, account: dict):
+        """Replace the book with a get_account() snapshot"""
+        self._balances = {
+            b['asset']: (float(b['free']), float(b['locked']))
+            for b in account.get('balances', [])
+            if float(b['free']) + float(b['locked']) > 0
+        }
+        self.seeded = True
+        self.updated_at = time.time()
+
+    def apply(self, event: dict):
+        """Apply one user data stream event"""
+        event_type = event.get('e')
+        event_time = event.get('E', 0)
+
+        if event_type == 'outboundAccountPosition':
+            # Absolute balances of every asset changed by the update
+            for entry in event.get('B', []):
+                self._balances[entry['a']] = (float(entry['f']), float(entry['l']))
+        elif event_type == 'balanceUpdate':
+            # Deposits, withdrawals and transfers: a delta on the free balance
+            free, locked = self._balances.get(event['a'], (0.0, 0.0))
+            self._balances[event['a']] = (free + float(event['d']), locked)
+        elif event_type == 'executionReport':
+            self.orders[event['i']] = event
+            self.orders.move_to_end(event['i'])
+            while len(self.orders) > self.MAX_ORDERS:
+                self.orders.popitem(last=False)
+        else:
+            return
+
+        self.last_event_time = max(self.last_event_time, event_time)
+        self.updated_at = time.time()
+
+    def balances(self) -> dict:
+        """{asset: {'free', 'locked', 'total'}} of non-zero balances"""
+        return {
+            asset: {'free': free, 'locked': locked, 'total': free + locked}
+            for asset, (free, locked) in list(self._balances.items())
+            if free + locked > 0
+        }
+
+    def order_status(self, order_id) -> str:
+        """Last reported status of an order ('NEW', 'FILLED', ...) or None"""
+        report = self.orders.get(order_id)
+        return report.get('X') if report else None
+
+
+class UserDataStream:
+    """User data stream of one account, running in its own daemon thread"""
+
+    RECONNECT_DELAY_MAX = 60
+
+    _instances = weakref.WeakKeyDictionary()
+    _instances_lock = threading.Lock()
+
+    def __init__(self, client, base_url: str = None):
+        self.client = client
+        self.base_url = base_url or next(
+            (url for prefix, url in USER_STREAM_URLS.items() if endpoint_key(client).startswith(prefix)), None
+        )
+        self.book = AccountBalanceBook()
+        self.connected = False
+        self.listen_key = None
+        self._stopped = threading.Event()
+        self._thread = None
+        self._keepalive_thread = None
+        self._loop = None
+        self._ws = None
+        self._start_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, client):
+        """Stream for the client's account, or None if streaming is unavailable"""
+        if not USER_STREAM_ENABLED or websockets is None:
+            return None
+        with cls._instances_lock:
+            stream = cls._instances.get(client)
+            if stream is None:
+                stream = cls(client)
+                if stream.base_url is None:
+                    return None
+                cls._instances[client] = stream
+            return stream
+
+    @property
+    def is_live(self) -> bool:
+        """True while the book reflects the account (connected and seeded)"""
+        return self.connected and self.book.seeded
+
+    def start(self):
+        """Start the stream and keepalive threads (idempotent)"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._thread_main, name='user-data-stream', daemon=True)
+            self._thread.start()
+            self._keepalive_thread = threading.Thread(
+                target=self._keepalive, name='user-data-keepalive', daemon=True
+            )
+            self._keepalive_thread.start()
+
+    def stop(self, timeout: float = 5):
+        """Close the stream, invalidate the listenKey and wait for both threads to exit"""
+        self._stopped.set()
+        if self._loop is not None and self._ws is not None:
+            asyncio.run_coroutine_threadsafe(self._ws.close(), self._loop)
+        for thread in (self._thread, self._keepalive_thread):
+            if thread is not None and thread is not threading.current_thread():
+                thread.join(timeout)
+        if self.listen_key:
+            try:
+                self.client.stream_close(listenKey=self.listen_key)
+            except Exception as e:
+                debug_logger.debug(f"Failed to close listenKey: {e}")
+            self.listen_key = None
+        self.connected = False
+
+    def handle_message(self, message):
+        event = json.loads(message)
+        if event.get('e') == 'listenKeyExpired':
+            # Reconnect with a fresh key
+            self.listen_key = None
+            raise ConnectionResetError("listenKey expired")
+        self.book.apply(event)
+
+    def _thread_main(self):
+        asyncio.run(self._run())
+
+    def _keepalive(self):
+        while not self._stopped.wait(LISTEN_KEY_KEEPALIVE):
+            if not self.listen_key:
+                continue
+            try:
+                self.client.stream_keepalive(listenKey=self.listen_key)
+                debug_logger.debug("User data stream listenKey renewed")
+            except Exception as e:
+                error_logger.warning(f"listenKey keepalive failed: {e}")
+                self.listen_key = None  # the stream loop requests a new one
+
+    async def _run(self):
+        self._loop = asyncio.get_running_loop()
+        delay = 1
+        while not self._stopped.is_set():
+            try:
+                if not self.listen_key:
+                    self.listen_key = await self._loop.run_in_executor(None, self.client.stream_get_listen_key)
+                async with websockets.connect(self.base_url + self.listen_key,
+                                              ping_interval=20, close_timeout=5) as ws:
+                    self._ws = ws
+                    # Seed after subscribing so no event falls between snapshot and stream
+                    account = await self._loop.run_in_executor(None, self.client.get_account)
+                    self.book.seed(account)
+                    self.connected = True
+                    delay = 1
+                    api_logger.info("User data stream connected")
+                    async for message in ws:
+                        self.handle_message(message)
+            except Exception as e:
+                if not self._stopped.is_set():
+                    error_logger.warning(f"User data stream error: {e}")
+            finally:
+                self.connected = False
+                self._ws = None
+
+            if self._stopped.is_set():
+                break
+            # Backoff that stop() cuts short
+            if await self._loop.run_in_executor(None, self._stopped.wait, delay):
+                break
+            delay = min(delay * 2, self.RECONNECT_DELAY_MAX)